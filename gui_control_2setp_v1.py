@@ -68,6 +68,9 @@ class Ur16GUI(tk.Tk):
                 print('Failed to start data synchronization')
                 sys.exit()
 
+            # Keep the newest robot state available without blocking the GUI
+            self.mailbox = self.con.start_receiver()
+
             for i in range(6):
                 self.setp.__setattr__(f'input_double_register_{i}', 0)
             
@@ -152,8 +155,15 @@ class Ur16GUI(tk.Tk):
             self.textboxes.append(textbox)
     
     def button_clicked(self, i):
-        for _ in range(200):
-            state = self.con.receive()
+        snapshot = self.mailbox.latest()
+        if snapshot.state is None and not self.mailbox.closed:
+            # Nothing received yet, wait for the first state
+            snapshot = self.mailbox.wait_next(snapshot.sequence, rtde.DEFAULT_TIMEOUT)
+        if snapshot is None or self.mailbox.closed:
+            # The receiver has stopped, the last pose would be stale
+            messagebox.showerror("Connection Error", "No data received from robot")
+            return
+        state = snapshot.state
         current_position = state.actual_TCP_pose
         print(current_position)
         
@@ -186,17 +196,18 @@ class Ur16GUI(tk.Tk):
             def setp_to_list(sp):
                 sp_list = []
                 for i in range(0, 6):
-                    sp_list.append(sp.__dict__["input_double_register_%i" % i])
+                    sp_list.append(getattr(sp, "input_double_register_%i" % i))
                 return sp_list
             
             def list_to_setp(sp, list):
                 for i in range(0, 6):
-                    sp.__dict__["input_double_register_%i" % i] = list[i]
+                    setattr(sp, "input_double_register_%i" % i, list[i])
                 return sp
 
             # Start data synchronization
             if not self.con.send_start():
                 sys.exit()
+            self.mailbox = self.con.start_receiver()
 
             # Initialise plotting parameters
             plot_time = []
@@ -208,22 +219,25 @@ class Ur16GUI(tk.Tk):
             repetition_counter = 0
             repetition = int(self.rep_entry.get())
             move_completed = True
+            sequence = None
 
             # Robot main control loop
             while self.keep_running:
                 if repetition_counter < repetition:
-                    state = self.con.receive()
-
-                    if state is None:
+                    snapshot = self.mailbox.wait_next(sequence, rtde.DEFAULT_TIMEOUT)
+                    if snapshot is None:
                         break
+                    sequence = snapshot.sequence
+                    state = snapshot.state
 
+                    new_setpoint = False
                     if move_completed and state.output_int_register_0 == 1:
                         move_completed = False
                         new_setp = setp1 if setp_to_list(self.setp) == setp2 else setp2
                         list_to_setp(self.setp, new_setp)
                         print("New pose = " + str(new_setp))
-                        # Send new setpoint
-                        self.con.send(self.setp)
+                        # Send new setpoint together with the watchdog kick
+                        new_setpoint = True
                         self.watchdog.input_int_register_0 = 1
 
                     elif not move_completed and state.output_int_register_0 == 0:
@@ -263,7 +277,10 @@ class Ur16GUI(tk.Tk):
                         # Handle movement delay
                         sleep(1)
 
-                    self.con.send(self.watchdog)
+                    if new_setpoint:
+                        self.con.send_many([self.setp, self.watchdog])
+                    else:
+                        self.con.send(self.watchdog)
                 else:
                     break
 
@@ -38,16 +38,12 @@ class CSVWriter(object):
         self.__types = types
         self.__header_names = []
         self.__columns = 0
+        self.__vectors = []
         for i in range(len(self.__names)):
-            size = serialize.get_item_size(self.__types[i])
-            self.__columns += size
-            if size > 1:
-                for j in range(size):
-                    name = self.__names[i] + "_" + str(j)
-                    self.__header_names.append(name)
-            else:
-                name = self.__names[i]
-                self.__header_names.append(name)
+            field_type = serialize.get_field_type(self.__types[i])
+            self.__columns += field_type.count
+            self.__vectors.append(field_type.vector)
+            self.__header_names.extend(field_type.columns(self.__names[i]))
         self.__writer = csv.writer(csvfile, delimiter=delimiter)
 
     def writeheader(self):
@@ -56,9 +52,8 @@ class CSVWriter(object):
     def writerow(self, data_object):
         data = []
         for i in range(len(self.__names)):
-            size = serialize.get_item_size(self.__types[i])
-            value = data_object.__dict__[self.__names[i]]
-            if size > 1:
+            value = getattr(data_object, self.__names[i])
+            if self.__vectors[i]:
                 data.extend(value)
             else:
                 data.append(value)
@@ -0,0 +1,146 @@
+import logging
+import struct
+import time
+
+from . import serialize
+from .rtde import Command, LOGNAME, ReceiveBuffer
+
+_log = logging.getLogger(LOGNAME)
+
+MAGIC = b"RTDECAP1"
+
+# kind, time.monotonic_ns(), length
+_record = struct.Struct(">BQI")
+
+STREAM_RECORD = 0
+RECIPE_RECORD = 1
+# Starts a capture or a connection, the stream does not continue the last one
+SESSION_RECORD = 2
+
+
+class CaptureWriter(object):
+    """Appends the raw bytes received from the controller to a capture file.
+
+    Every socket read becomes one stream record with the monotonic time the
+    read returned, so capturing costs one buffered write per read and no
+    per-packet work. Output recipes are stored in recipe records with their
+    variable names, which the controller never sends back. A session record
+    marks every start of a capture or connection, as the file is appended to.
+    """
+
+    def __init__(self, file, buffering=1 << 16):
+        if isinstance(file, str):
+            self.__file = open(file, "ab", buffering)
+            self.__owned = True
+        else:
+            self.__file = file
+            self.__owned = False
+        if self.__file.tell() == 0:
+            self.__file.write(MAGIC)
+
+    def write_stream(self, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        self.__file.write(_record.pack(STREAM_RECORD, timestamp, len(data)))
+        self.__file.write(data)
+
+    def write_session(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        self.__file.write(_record.pack(SESSION_RECORD, timestamp, 0))
+
+    def write_recipe(self, config, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        data = config.pack_description()
+        self.__file.write(_record.pack(RECIPE_RECORD, timestamp, len(data)))
+        self.__file.write(data)
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        if self.__owned:
+            self.__file.close()
+        else:
+            self.__file.flush()
+
+
+def read_records(file):
+    """Yield (kind, timestamp, data) for every record of a capture file"""
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not an RTDE capture file")
+    while True:
+        header = file.read(_record.size)
+        if len(header) < _record.size:
+            return
+        kind, timestamp, length = _record.unpack(header)
+        data = file.read(length)
+        if len(data) < length:
+            _log.warning("Capture file ends with a truncated record")
+            return
+        yield kind, timestamp, data
+
+
+class Replay(object):
+    """Replays a capture file through the data package decoder.
+
+    speed 1.0 replays in real time, 10.0 ten times as fast and None as fast
+    as possible. Iterating yields (timestamp, state) for every data package,
+    decoded with the codec of its recipe, timestamp is the capture time in
+    nanoseconds. packets() yields the raw (timestamp, command, payload).
+    """
+
+    def __init__(self, filename, speed=1.0):
+        self.filename = filename
+        self.speed = speed
+        self.recipes = {}
+
+    def packets(self):
+        buf = ReceiveBuffer()
+        start = None
+        with open(self.filename, "rb") as file:
+            for kind, timestamp, data in read_records(file):
+                if kind == RECIPE_RECORD:
+                    config = serialize.DataConfig.unpack_description(data)
+                    config.compile()
+                    self.recipes[config.id] = config
+                    continue
+                if kind == SESSION_RECORD:
+                    # A partial packet of the last session is never completed
+                    # and monotonic time restarts with a reboot
+                    buf.clear()
+                    start = None
+                    continue
+                if start is None:
+                    start = (timestamp, time.monotonic())
+                elif self.speed:
+                    delay = (timestamp - start[0]) / 1e9 / self.speed - (
+                        time.monotonic() - start[1]
+                    )
+                    if delay > 0:
+                        time.sleep(delay)
+                view = buf.reserve()
+                if len(data) > len(view):
+                    raise ValueError("Capture record exceeds the receive buffer")
+                view[: len(data)] = data
+                buf.commit(len(data))
+                for packet in self.__drain(buf, timestamp):
+                    yield packet
+
+    def __drain(self, buf, timestamp):
+        packet = buf.next_packet()
+        while packet is not None:
+            yield timestamp, packet[0], packet[1]
+            packet = buf.next_packet()
+
+    def __iter__(self):
+        recipes = self.recipes
+        for timestamp, command, payload in self.packets():
+            if command != Command.RTDE_DATA_PACKAGE:
+                continue
+            config = recipes.get(payload[0])
+            if config is None:
+                _log.error("RTDE_DATA_PACKAGE: Missing output configuration")
+                continue
+            yield timestamp, config.codec.unpack(payload)
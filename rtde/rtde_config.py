@@ -21,11 +21,43 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import difflib
+import hashlib
+import json
+import logging
+import os
+import struct
 import xml.etree.ElementTree as ET
 
+from rtde import serialize
+from rtde.rtde import LOGNAME
+from rtde.rtde_variables import VARIABLES
+
+_log = logging.getLogger(LOGNAME)
+
+# path -> (mtime, digest, recipes, validated) of every file loaded in this
+# process
+_cache = {}
+
+# bumped whenever the sidecar cache layout changes
+CACHE_VERSION = 2
+
+
+def clear_cache():
+    _cache.clear()
+
 
 class Recipe(object):
-    __slots__ = ["key", "names", "types"]
+    """A recipe of a configuration file, compiled when the file is loaded.
+
+    fmt and size describe a data package of the recipe including the
+    recipe id byte, as DataConfig.fmt does. header holds the CSV column
+    names and dtype the NumPy structured dtype (None without NumPy, built
+    on first use). All four are None if a type is unknown to
+    serialize.TYPES.
+    """
+
+    __slots__ = ["key", "names", "types", "fmt", "size", "header", "_dtype"]
 
     @staticmethod
     def parse(recipe_node):
@@ -35,17 +67,130 @@ class Recipe(object):
         rmd.types = [f.get("type") for f in recipe_node.findall("field")]
         return rmd
 
+    def compile(self):
+        self._dtype = None
+        if any(t not in serialize.TYPES for t in self.types):
+            # only passes with validate=False, the layout stays unknown
+            self.fmt = self.size = self.header = None
+            return self
+        field_types = [serialize.TYPES[t] for t in self.types]
+        self.fmt = ">B" + "".join(t.format for t in field_types)
+        self.size = struct.calcsize(self.fmt)
+        self.header = []
+        for name, field_type in zip(self.names, field_types):
+            self.header.extend(field_type.columns(name))
+        return self
+
+    @property
+    def dtype(self):
+        if self._dtype is None and self.fmt is not None:
+            if serialize.np is not None:
+                self._dtype = serialize.numpy_dtype(self.names, self.types)
+        return self._dtype
+
+    def validate(self):
+        """Raise ValueError for unknown types and for variables whose type
+        differs from the catalog. Variables missing from the catalog are
+        only logged, the controller may be newer than the catalog."""
+        errors = []
+        for name, data_type in zip(self.names, self.types):
+            if data_type not in serialize.TYPES:
+                errors.append("%s: unknown type %s" % (name, data_type))
+            elif name not in VARIABLES:
+                close = difflib.get_close_matches(name, VARIABLES, 1)
+                _log.warning(
+                    "Recipe '%s': unknown variable %s%s",
+                    self.key,
+                    name,
+                    ", did you mean " + close[0] if close else "",
+                )
+            elif VARIABLES[name] != data_type:
+                errors.append(
+                    "%s: type %s, expected %s" % (name, data_type, VARIABLES[name])
+                )
+        if errors:
+            raise ValueError(
+                "Invalid recipe '%s': %s" % (self.key, "; ".join(errors))
+            )
+
 
 class ConfigFile(object):
-    def __init__(self, filename):
+    """Recipes of an RTDE configuration file.
+
+    Compiled recipes are shared by all ConfigFile objects of the same file
+    as long as its modification time and content hash do not change, so
+    reopening a file costs a stat and a hash. cache_file (True for the
+    file name plus ".cache") also persists the compiled recipes next to
+    the file, so the next process skips parsing and compiling. With
+    validate, names and types are checked against the rtde_variables
+    catalog: unknown types and type mismatches raise a ValueError naming
+    all of them, unknown variables are logged.
+    """
+
+    def __init__(self, filename, validate=True, cache_file=None):
         self.__filename = filename
-        tree = ET.parse(self.__filename)
-        root = tree.getroot()
-        recipes = [Recipe.parse(r) for r in root.findall("recipe")]
+        path = os.path.abspath(filename)
+        with open(path, "rb") as f:
+            data = f.read()
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+        digest = hashlib.sha1(data).hexdigest()
+        cached = _cache.get(path)
+        hit = cached is not None and cached[0] == mtime and cached[1] == digest
+        if hit:
+            recipes = cached[2]
+        else:
+            if cache_file is True:
+                cache_file = path + ".cache"
+            recipes = None
+            if cache_file:
+                recipes = self.__load_cache(cache_file, digest)
+            if recipes is None:
+                root = ET.fromstring(data)
+                recipes = [Recipe.parse(r).compile() for r in root.findall("recipe")]
+                if cache_file:
+                    self.__save_cache(cache_file, digest, recipes)
+        validated = hit and cached[3]
+        if validate and not validated:
+            for r in recipes:
+                r.validate()
+            validated = True
+        _cache[path] = (mtime, digest, recipes, validated)
         self.__dictionary = dict()
         for r in recipes:
             self.__dictionary[r.key] = r
 
     def get_recipe(self, key):
         r = self.__dictionary[key]
-        return r.names, r.types
+        return list(r.names), list(r.types)
+
+    def get_compiled_recipe(self, key):
+        """The Recipe object, shared with other ConfigFiles of the file"""
+        return self.__dictionary[key]
+
+    @staticmethod
+    def __load_cache(cache_file, digest):
+        try:
+            with open(cache_file) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("version") != CACHE_VERSION or cached.get("digest") != digest:
+            return None
+        recipes = []
+        for entry in cached["recipes"]:
+            r = Recipe()
+            r.key, r.names, r.types, r.fmt, r.size, r.header = entry
+            r._dtype = None
+            recipes.append(r)
+        return recipes
+
+    @staticmethod
+    def __save_cache(cache_file, digest, recipes):
+        entries = [[r.key, r.names, r.types, r.fmt, r.size, r.header] for r in recipes]
+        try:
+            with open(cache_file, "w") as f:
+                json.dump(
+                    {"version": CACHE_VERSION, "digest": digest, "recipes": entries}, f
+                )
+        except OSError:
+            pass
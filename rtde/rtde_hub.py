@@ -0,0 +1,138 @@
+import logging
+import selectors
+import time
+
+from .rtde import LOGNAME, RTDEException
+
+_log = logging.getLogger(LOGNAME)
+
+
+class RobotStats(object):
+    __slots__ = [
+        "packets",
+        "skipped",
+        "rate",
+        "last_arrival",
+        "_window_start",
+        "_window_packets",
+    ]
+
+    def __init__(self):
+        self.packets = 0
+        self.skipped = 0
+        self.rate = 0.0
+        self.last_arrival = None
+        self._window_start = time.monotonic()
+        self._window_packets = 0
+
+
+class _Session(object):
+    __slots__ = ["name", "connection", "fd", "callback", "latest_only", "stats"]
+
+    def __init__(self, name, connection, callback, latest_only):
+        self.name = name
+        self.connection = connection
+        self.fd = connection.fileno()
+        self.callback = callback
+        self.latest_only = latest_only
+        self.stats = RobotStats()
+
+
+class RTDEHub(object):
+    """Services several started RTDE sessions from one selector loop.
+
+    Each readable connection is drained in one go and its data packages are
+    passed to callback(name, state). With latest_only, only the newest
+    package of every drained batch is dispatched and the rest are counted
+    as skipped. Callbacks run while the connection's receive_lock is held:
+    they may send() inputs, but not call send_start() or other commands
+    that wait for a reply.
+    """
+
+    RATE_WINDOW = 1.0
+
+    def __init__(self):
+        self.__selector = selectors.DefaultSelector()
+        self.__sessions = {}
+        self.__running = False
+
+    def add(self, name, connection, callback, latest_only=False):
+        session = _Session(name, connection, callback, latest_only)
+        self.__selector.register(session.fd, selectors.EVENT_READ, session)
+        self.__sessions[name] = session
+
+    def remove(self, name):
+        session = self.__sessions.pop(name)
+        self.__selector.unregister(session.fd)
+
+    def names(self):
+        return list(self.__sessions)
+
+    def stats(self, name):
+        return self.__sessions[name].stats
+
+    def poll(self, timeout=None):
+        """Service all readable sessions once, returns the number of packages
+        dispatched."""
+        dispatched = 0
+        for key, _ in self.__selector.select(timeout):
+            dispatched += self.__service(key.data)
+        return dispatched
+
+    def run(self, duration=None):
+        """Poll until stop() is called, all sessions are gone or duration
+        seconds have passed."""
+        self.__running = True
+        end = None if duration is None else time.monotonic() + duration
+        while self.__running and self.__sessions:
+            timeout = 1.0
+            if end is not None:
+                timeout = end - time.monotonic()
+                if timeout <= 0:
+                    break
+            self.poll(min(timeout, 1.0))
+
+    def stop(self):
+        self.__running = False
+
+    def close(self):
+        for name in list(self.__sessions):
+            self.remove(name)
+        self.__selector.close()
+
+    def __service(self, session):
+        connection = session.connection
+        skipped = connection.skipped_package_count
+        # States are passed on as they are decoded, a list of the whole
+        # backlog would be slower. The lock keeps other threads from reading
+        # into the buffer the packages point to.
+        with connection.receive_lock:
+            states = connection.iter_packets(last=1 if session.latest_only else None)
+            try:
+                # reads the socket
+                state = next(states)
+            except StopIteration:
+                return 0
+            except RTDEException as e:
+                _log.error("Robot " + str(session.name) + " disconnected: " + str(e))
+                self.remove(session.name)
+                return 0
+            now = time.monotonic()
+            session.callback(session.name, state)
+            dispatched = 1
+            for state in states:
+                session.callback(session.name, state)
+                dispatched += 1
+        skipped = connection.skipped_package_count - skipped
+
+        stats = session.stats
+        stats.last_arrival = now
+        stats.packets += dispatched + skipped
+        stats.skipped += skipped
+        stats._window_packets += dispatched + skipped
+        elapsed = now - stats._window_start
+        if elapsed >= self.RATE_WINDOW:
+            stats.rate = stats._window_packets / elapsed
+            stats._window_start = now
+            stats._window_packets = 0
+        return dispatched
@@ -0,0 +1,398 @@
+"""Fan-out proxy sharing one robot connection with local clients.
+
+RTDEProxy holds the RTDE connection to the controller and speaks the RTDE
+protocol to any number of clients on a Unix domain socket, so the usual
+client code works unchanged with the socket path as hostname:
+
+    con = rtde.RTDE("/tmp/rtde.sock")
+
+A client's output setup picks a subset of the proxy's output recipe
+(sliced out of every raw frame) and a frequency: below the proxy's own
+frequency every Nth frame is forwarded, at or above it every frame.
+Input setups are granted per register, a register written by one client
+is reported IN_USE to the others. Clients that do not keep up lose data
+packages instead of slowing down the robot link.
+
+Run standalone with python -m rtde.rtde_proxy, see --help.
+"""
+
+import argparse
+import logging
+import os
+import selectors
+import socket
+import struct
+import time
+
+from . import serialize
+from .rtde import (
+    Command,
+    LOGNAME,
+    RTDE,
+    RTDEException,
+    RTDE_PROTOCOL_VERSION_1,
+    ReceiveBuffer,
+)
+
+_log = logging.getLogger(LOGNAME + ".proxy")
+
+_header = struct.Struct(">HB")
+
+# Data packages are dropped for a client with more bytes than this queued
+MAX_PENDING = 1 << 16
+
+
+class _Client(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf = ReceiveBuffer(1 << 16)
+        self.out = bytearray()
+        self.writing = False
+        self.protocol = RTDE_PROTOCOL_VERSION_1
+        self.started = False
+        # output projection, None for the full recipe
+        self.slices = None
+        # forward every Nth frame, skip counts down to the next one
+        self.every = 1
+        self.skip = 0
+        self.inputs = {}
+        self.next_input_id = 1
+        self.sent = 0
+        self.dropped = 0
+
+
+class RTDEProxy(object):
+    """Shares a connected, not yet started RTDE session, see the module
+    docstring. The proxy sets up the output recipe and one input recipe
+    per register in input_names on the robot and starts synchronization.
+    """
+
+    def __init__(
+        self,
+        connection,
+        path,
+        output_names,
+        output_types=[],
+        frequency=500,
+        input_names=(),
+    ):
+        self.path = path
+        self.__connection = connection
+        self.__version = connection.get_controller_version()
+        self.__frequency = frequency
+        recipe_id = connection.send_output_setup(output_names, output_types, frequency)
+        if not recipe_id:
+            raise RTDEException("Unable to configure output")
+        self.__recipe_id = recipe_id
+        self.__types = {}
+        self.__slices = {}
+        offset = 1
+        config = connection.get_output_config(recipe_id)
+        for name, data_type in zip(config.names, config.types):
+            size = serialize.get_field_type(data_type).size
+            self.__types[name] = data_type
+            self.__slices[name] = (offset, offset + size)
+            offset += size
+        self.__output_names = list(config.names)
+        self.__inputs = {}
+        for name in input_names:
+            state = connection.send_input_setup([name])
+            if state is None:
+                raise RTDEException("Unable to configure input " + name)
+            self.__inputs[name] = state
+        self.__owners = {}
+        # Keep the raw payloads, the proxy never decodes data packages
+        self.__decode = connection.register_handler(Command.RTDE_DATA_PACKAGE, bytes)
+        if not connection.send_start():
+            raise RTDEException("Unable to start synchronization")
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server.bind(path)
+        self.__server.listen(64)
+        self.__server.setblocking(False)
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.__server, selectors.EVENT_READ, None)
+        self.__robot_fd = connection.fileno()
+        self.__selector.register(self.__robot_fd, selectors.EVENT_READ, connection)
+        self.__clients = {}
+        self.__running = False
+        self.packages = 0
+
+    def clients(self):
+        """(sent, dropped) data package counts of every connected client"""
+        return [(c.sent, c.dropped) for c in self.__clients.values()]
+
+    def poll(self, timeout=None):
+        for key, events in self.__selector.select(timeout):
+            if key.data is None:
+                self.__accept()
+            elif key.data is self.__connection:
+                self.__on_robot()
+            else:
+                if events & selectors.EVENT_READ:
+                    self.__on_client_readable(key.data)
+                if events & selectors.EVENT_WRITE and key.data.sock in self.__clients:
+                    self.__flush(key.data)
+
+    def run(self, duration=None):
+        """Serve until stop() is called, the robot disconnects or duration
+        seconds have passed."""
+        self.__running = True
+        end = None if duration is None else time.monotonic() + duration
+        while self.__running:
+            timeout = 1.0
+            if end is not None:
+                timeout = end - time.monotonic()
+                if timeout <= 0:
+                    break
+            self.poll(min(timeout, 1.0))
+
+    def stop(self):
+        self.__running = False
+
+    def close(self):
+        for client in list(self.__clients.values()):
+            self.__drop(client)
+        self.__selector.close()
+        self.__server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.__connection.register_handler(Command.RTDE_DATA_PACKAGE, self.__decode)
+
+    # robot side
+
+    def __on_robot(self):
+        clients = [client for client in self.__clients.values() if client.started]
+        received = 0
+        try:
+            # Packages are forwarded as they are parsed, the lock keeps other
+            # threads from reading into the buffer they point to
+            with self.__connection.receive_lock:
+                for payload in self.__connection.iter_packets():
+                    received += 1
+                    for client in clients:
+                        if client.skip:
+                            # decimate by frame count, arrival times jitter
+                            client.skip -= 1
+                            continue
+                        client.skip = client.every - 1
+                        if len(client.out) > MAX_PENDING:
+                            client.dropped += 1
+                            continue
+                        frame = payload
+                        if client.slices is not None:
+                            frame = payload[:1] + b"".join(
+                                payload[start:end] for start, end in client.slices
+                            )
+                        client.out += _header.pack(
+                            len(frame) + 3, Command.RTDE_DATA_PACKAGE
+                        )
+                        client.out += frame
+                        client.sent += 1
+        except RTDEException as e:
+            _log.error("Robot disconnected: " + str(e))
+            self.__selector.unregister(self.__robot_fd)
+            self.stop()
+            return
+        if not received:
+            return
+        self.packages += received
+        for client in clients:
+            self.__flush(client)
+
+    # client side
+
+    def __accept(self):
+        try:
+            sock, _ = self.__server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = _Client(sock)
+        self.__clients[sock] = client
+        self.__selector.register(sock, selectors.EVENT_READ, client)
+
+    def __drop(self, client):
+        for name, owner in list(self.__owners.items()):
+            if owner is client:
+                del self.__owners[name]
+        self.__selector.unregister(client.sock)
+        del self.__clients[client.sock]
+        client.sock.close()
+
+    def __on_client_readable(self, client):
+        try:
+            received = client.buf.fill(client.sock)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            received = 0
+        if received == 0:
+            self.__drop(client)
+            return
+        packet = client.buf.next_packet()
+        while packet is not None:
+            self.__on_client_packet(client, packet[0], bytes(packet[1]))
+            packet = client.buf.next_packet()
+        self.__flush(client)
+
+    def __send(self, client, command, payload=b""):
+        client.out += _header.pack(len(payload) + 3, command)
+        client.out += payload
+
+    def __flush(self, client):
+        if client.out:
+            try:
+                sent = client.sock.send(client.out)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self.__drop(client)
+                return
+            del client.out[:sent]
+        writing = len(client.out) > 0
+        if writing != client.writing:
+            client.writing = writing
+            events = selectors.EVENT_READ
+            if writing:
+                events |= selectors.EVENT_WRITE
+            self.__selector.modify(client.sock, events, client)
+
+    def __on_client_packet(self, client, command, payload):
+        if command == Command.RTDE_DATA_PACKAGE:
+            self.__on_client_data(client, payload)
+        elif command == Command.RTDE_REQUEST_PROTOCOL_VERSION:
+            version = struct.unpack(">H", payload)[0]
+            accepted = version in (1, 2)
+            if accepted:
+                client.protocol = version
+            self.__send(client, command, struct.pack(">B", accepted))
+        elif command == Command.RTDE_GET_URCONTROL_VERSION:
+            self.__send(client, command, struct.pack(">IIII", *self.__version))
+        elif command == Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS:
+            self.__on_output_setup(client, command, payload)
+        elif command == Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS:
+            self.__on_input_setup(client, command, payload)
+        elif command == Command.RTDE_CONTROL_PACKAGE_START:
+            client.started = True
+            client.skip = 0
+            self.__send(client, command, struct.pack(">B", 1))
+        elif command == Command.RTDE_CONTROL_PACKAGE_PAUSE:
+            client.started = False
+            self.__send(client, command, struct.pack(">B", 1))
+        elif command == Command.RTDE_TEXT_MESSAGE:
+            _log.info("Client message: " + repr(payload))
+        else:
+            _log.error("Unknown package command: " + str(command))
+
+    def __on_output_setup(self, client, command, payload):
+        frequency = None
+        if client.protocol != RTDE_PROTOCOL_VERSION_1:
+            frequency = struct.unpack_from(">d", payload)[0]
+            payload = payload[8:]
+        names = payload.decode("utf-8").split(",")
+        types = [self.__types.get(name, "NOT_FOUND") for name in names]
+        recipe_id = 0
+        if "NOT_FOUND" not in types:
+            recipe_id = self.__recipe_id
+            client.slices = None
+            if names != self.__output_names:
+                client.slices = []
+                for name in names:
+                    start, end = self.__slices[name]
+                    if client.slices and client.slices[-1][1] == start:
+                        client.slices[-1] = (client.slices[-1][0], end)
+                    else:
+                        client.slices.append((start, end))
+            client.every = 1
+            if frequency and frequency < self.__frequency:
+                client.every = max(1, int(round(self.__frequency / frequency)))
+        self.__send(
+            client,
+            command,
+            bytes(bytearray([recipe_id])) + ",".join(types).encode("utf-8"),
+        )
+
+    def __on_input_setup(self, client, command, payload):
+        names = payload.decode("utf-8").split(",")
+        types = []
+        for name in names:
+            if name not in self.__inputs:
+                types.append("NOT_FOUND")
+            elif self.__owners.get(name, client) is not client:
+                types.append("IN_USE")
+            else:
+                state = self.__inputs[name]
+                config = self.__connection.get_input_config(state.recipe_id)
+                types.append(config.types[0])
+        recipe_id = 0
+        if not any(t in ("NOT_FOUND", "IN_USE") for t in types):
+            for name in names:
+                self.__owners[name] = client
+            recipe_id = client.next_input_id
+            client.next_input_id += 1
+            config = serialize.DataConfig.unpack_recipe(
+                bytes(bytearray([recipe_id])) + ",".join(types).encode("utf-8")
+            )
+            config.names = names
+            config.compile()
+            client.inputs[recipe_id] = config
+        self.__send(
+            client,
+            command,
+            bytes(bytearray([recipe_id])) + ",".join(types).encode("utf-8"),
+        )
+
+    def __on_client_data(self, client, payload):
+        config = client.inputs.get(bytearray(payload)[0])
+        if config is None:
+            _log.error("RTDE_DATA_PACKAGE: Unknown input recipe from client")
+            return
+        values = config.unpack(payload)
+        states = []
+        for name in config.names:
+            state = self.__inputs[name]
+            setattr(state, name, getattr(values, name))
+            states.append(state)
+        try:
+            self.__connection.send_many(states)
+        except RTDEException as e:
+            _log.error("Unable to forward input: " + str(e))
+
+
+def main():
+    from . import rtde_config
+
+    parser = argparse.ArgumentParser(description="RTDE fan-out proxy")
+    parser.add_argument("--host", default="localhost", help="controller host")
+    parser.add_argument("--port", type=int, default=30004)
+    parser.add_argument("--path", default="/tmp/rtde.sock", help="socket path")
+    parser.add_argument("--config", default="control_loop_configuration.xml")
+    parser.add_argument("--recipe", default="state", help="output recipe key")
+    parser.add_argument("--frequency", type=int, default=500)
+    parser.add_argument(
+        "--inputs", nargs="*", default=[], help="input registers clients may write"
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    names, types = rtde_config.ConfigFile(args.config).get_recipe(args.recipe)
+    con = RTDE(args.host, args.port)
+    con.connect()
+    proxy = RTDEProxy(con, args.path, names, types, args.frequency, args.inputs)
+    print("Serving " + args.host + " on " + args.path)
+    try:
+        proxy.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.close()
+        con.send_pause()
+        con.disconnect()
+
+
+if __name__ == "__main__":
+    main()
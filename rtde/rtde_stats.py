@@ -0,0 +1,193 @@
+import gc
+import time
+
+
+class LatencyHistogram(object):
+    """Fixed-memory log-linear histogram of nanosecond values.
+
+    Values below 32 ns get their own bucket, above that every power of two
+    is split into 16 buckets (about 6% resolution), up to 2**41 ns, roughly
+    36 minutes. Recording is a few integer operations and never allocates, so
+    it can be read at any time while the loop keeps recording.
+    """
+
+    SUB_BITS = 5
+    HALF = 1 << (SUB_BITS - 1)
+    MAX_SHIFT = 36
+
+    def __init__(self):
+        self.counts = [0] * ((self.MAX_SHIFT + 2) * self.HALF)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self.SUB_BITS
+        if shift <= 0:
+            index = value
+        elif shift > self.MAX_SHIFT:
+            index = len(self.counts) - 1
+        else:
+            index = shift * self.HALF + (value >> shift)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __bucket_upper(self, index):
+        if index < 2 * self.HALF:
+            return index
+        shift = index // self.HALF - 1
+        return ((index - shift * self.HALF + 1) << shift) - 1
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding the given percentile, in ns"""
+        if self.count == 0:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.__bucket_upper(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / float(self.count) if self.count else None
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "min": self.min,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+class SessionStats(object):
+    """Timing and traffic counters of one RTDE session.
+
+    All times are time.monotonic_ns() values. Data package arrival is the
+    time the read that completed the package returned. The turnaround is
+    measured from receive() returning a state to the first send after it,
+    processing from that read to receive() returning. GC pauses are
+    recorded while the stats are enabled, to tell them apart from network
+    delay.
+
+    With kernel timestamps, kernel_to_user is the delay from the kernel
+    receiving the data to the read returning, and controller_jitter the
+    spread of the arrival time relative to the controller's timestamp
+    field: the controller clock has an unknown offset, so each sample is
+    measured against the smallest arrival - timestamp seen so far.
+    """
+
+    def __init__(self):
+        self.inter_arrival = LatencyHistogram()
+        self.turnaround = LatencyHistogram()
+        self.processing = LatencyHistogram()
+        self.kernel_to_user = LatencyHistogram()
+        self.controller_jitter = LatencyHistogram()
+        self.gc_pause = LatencyHistogram()
+        self.__controller_offset = None
+        self.last_arrival = None
+        self.last_fill = None
+        self.last_receive = None
+        self.packages_received = 0
+        self.packets_received = 0
+        self.packets_sent = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.recv_calls = 0
+        self.send_calls = 0
+        self.select_calls = 0
+        self.__gc_start = None
+
+    def on_recv(self, received):
+        self.last_fill = time.monotonic_ns()
+        self.recv_calls += 1
+        self.bytes_received += received
+
+    def on_packet(self, command, data_package):
+        self.packets_received += 1
+        if data_package:
+            self.packages_received += 1
+            if self.last_arrival is not None:
+                self.inter_arrival.record(self.last_fill - self.last_arrival)
+            self.last_arrival = self.last_fill
+
+    def on_receive(self):
+        self.last_receive = time.monotonic_ns()
+        if self.last_fill is not None:
+            self.processing.record(self.last_receive - self.last_fill)
+
+    def on_kernel_timestamp(self, kernel_ns):
+        self.kernel_to_user.record(time.time_ns() - kernel_ns)
+
+    def on_controller_timestamp(self, timestamp, arrival_ns):
+        offset = arrival_ns - int(timestamp * 1e9)
+        if self.__controller_offset is None or offset < self.__controller_offset:
+            self.__controller_offset = offset
+        self.controller_jitter.record(offset - self.__controller_offset)
+
+    def on_send(self, sent, packets):
+        self.send_calls += 1
+        self.packets_sent += packets
+        self.bytes_sent += sent
+        if self.last_receive is not None:
+            self.turnaround.record(time.monotonic_ns() - self.last_receive)
+            self.last_receive = None
+
+    def on_select(self):
+        self.select_calls += 1
+
+    def attach_gc(self):
+        gc.callbacks.append(self.__on_gc)
+
+    def detach_gc(self):
+        if self.__on_gc in gc.callbacks:
+            gc.callbacks.remove(self.__on_gc)
+
+    def __on_gc(self, phase, info):
+        if phase == "start":
+            self.__gc_start = time.monotonic_ns()
+        elif self.__gc_start is not None:
+            self.gc_pause.record(time.monotonic_ns() - self.__gc_start)
+            self.__gc_start = None
+
+    def reset(self):
+        self.__init__()
+
+    def summary(self):
+        return {
+            "packages_received": self.packages_received,
+            "packets_received": self.packets_received,
+            "packets_sent": self.packets_sent,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "recv_calls": self.recv_calls,
+            "send_calls": self.send_calls,
+            "select_calls": self.select_calls,
+            "inter_arrival": self.inter_arrival.summary(),
+            "turnaround": self.turnaround.summary(),
+            "processing": self.processing.summary(),
+            "kernel_to_user": self.kernel_to_user.summary(),
+            "controller_jitter": self.controller_jitter.summary(),
+            "gc_pause": self.gc_pause.summary(),
+        }
@@ -0,0 +1,128 @@
+"""Catalog of the RTDE controller variables and their types.
+
+Used by rtde_config to validate recipes when they are loaded and by
+rtde_mock to answer setup requests. The catalog follows the RTDE guide,
+a controller may offer variables that are not listed here yet.
+"""
+
+
+def _variables():
+    variables = {
+        "timestamp": "DOUBLE",
+        "target_q": "VECTOR6D",
+        "target_qd": "VECTOR6D",
+        "target_qdd": "VECTOR6D",
+        "target_current": "VECTOR6D",
+        "target_moment": "VECTOR6D",
+        "actual_q": "VECTOR6D",
+        "actual_qd": "VECTOR6D",
+        "actual_current": "VECTOR6D",
+        "joint_control_output": "VECTOR6D",
+        "actual_TCP_pose": "VECTOR6D",
+        "actual_TCP_speed": "VECTOR6D",
+        "actual_TCP_force": "VECTOR6D",
+        "target_TCP_pose": "VECTOR6D",
+        "target_TCP_speed": "VECTOR6D",
+        "actual_digital_input_bits": "UINT64",
+        "joint_temperatures": "VECTOR6D",
+        "actual_execution_time": "DOUBLE",
+        "robot_mode": "INT32",
+        "joint_mode": "VECTOR6INT32",
+        "safety_mode": "INT32",
+        "safety_status": "INT32",
+        "actual_tool_accelerometer": "VECTOR3D",
+        "speed_scaling": "DOUBLE",
+        "target_speed_fraction": "DOUBLE",
+        "actual_momentum": "DOUBLE",
+        "actual_main_voltage": "DOUBLE",
+        "actual_robot_voltage": "DOUBLE",
+        "actual_robot_current": "DOUBLE",
+        "actual_joint_voltage": "VECTOR6D",
+        "actual_digital_output_bits": "UINT64",
+        "runtime_state": "UINT32",
+        "elbow_position": "VECTOR3D",
+        "elbow_velocity": "VECTOR3D",
+        "robot_status_bits": "UINT32",
+        "safety_status_bits": "UINT32",
+        "analog_io_types": "UINT32",
+        "standard_analog_input0": "DOUBLE",
+        "standard_analog_input1": "DOUBLE",
+        "standard_analog_output0": "DOUBLE",
+        "standard_analog_output1": "DOUBLE",
+        "io_current": "DOUBLE",
+        "euromap67_input_bits": "UINT32",
+        "euromap67_output_bits": "UINT32",
+        "euromap67_24V_voltage": "DOUBLE",
+        "euromap67_24V_current": "DOUBLE",
+        "tool_mode": "UINT32",
+        "tool_analog_input_types": "UINT32",
+        "tool_analog_input0": "DOUBLE",
+        "tool_analog_input1": "DOUBLE",
+        "tool_output_voltage": "INT32",
+        "tool_output_current": "DOUBLE",
+        "tool_temperature": "DOUBLE",
+        "tcp_force_scalar": "DOUBLE",
+        "output_bit_registers0_to_31": "UINT32",
+        "output_bit_registers32_to_63": "UINT32",
+        "input_bit_registers0_to_31": "UINT32",
+        "input_bit_registers32_to_63": "UINT32",
+        "speed_slider_mask": "UINT32",
+        "speed_slider_fraction": "DOUBLE",
+        "standard_digital_output_mask": "UINT8",
+        "standard_digital_output": "UINT8",
+        "configurable_digital_output_mask": "UINT8",
+        "configurable_digital_output": "UINT8",
+        "tool_digital_output_mask": "UINT8",
+        "tool_digital_output": "UINT8",
+        "standard_analog_output_mask": "UINT8",
+        "standard_analog_output_type": "UINT8",
+        "standard_analog_output_0": "DOUBLE",
+        "standard_analog_output_1": "DOUBLE",
+        "payload": "DOUBLE",
+        "payload_cog": "VECTOR3D",
+        "payload_inertia": "VECTOR6D",
+        "tcp_offset": "VECTOR6D",
+        "ft_raw_wrench": "VECTOR6D",
+        "external_force_torque": "VECTOR6D",
+        "script_control_line": "UINT32",
+        "actual_current_window": "VECTOR6D",
+        "actual_current_as_torque": "VECTOR6D",
+        "tool_output_mode": "UINT8",
+        "tool_digital_output0_mode": "UINT8",
+        "tool_digital_output1_mode": "UINT8",
+    }
+    for i in range(64, 128):
+        variables["output_bit_register_%d" % i] = "BOOL"
+        variables["input_bit_register_%d" % i] = "BOOL"
+    for i in range(48):
+        variables["output_int_register_%d" % i] = "INT32"
+        variables["output_double_register_%d" % i] = "DOUBLE"
+        variables["input_int_register_%d" % i] = "INT32"
+        variables["input_double_register_%d" % i] = "DOUBLE"
+    return variables
+
+
+# Name -> RTDE type of the controller variables known to this package
+VARIABLES = _variables()
+
+# Variables a client may write, everything else is output only
+INPUT_VARIABLES = frozenset(
+    name
+    for name in VARIABLES
+    if name.startswith("input_")
+    or name.endswith("_mask")
+    or name
+    in (
+        "speed_slider_fraction",
+        "standard_digital_output",
+        "configurable_digital_output",
+        "tool_digital_output",
+        "standard_analog_output_type",
+        "standard_analog_output_0",
+        "standard_analog_output_1",
+        "payload",
+        "payload_cog",
+        "payload_inertia",
+        "external_force_torque",
+    )
+)
@@ -0,0 +1,513 @@
+#!/usr/bin/env python
+# Offline benchmark suite for the RTDE stack.
+#
+# Covers recipe pack/unpack, packet parsing with backlogs, end-to-end loop
+# latency, dozens of robots through one RTDEHub (--robots, with the CPU time
+# per robot and missed packages), AsyncRTDE, 20 subscribers of an RTDEProxy
+# (all against local MockController instances), CSV log write/read and config
+# parsing.
+#
+# Every run appends one JSON record with the git commit and all results to
+# benchmark_results.jsonl, so regressions show up across commits:
+#
+#   python benchmark_suite.py [--quick] [--only NAME ...] [--robots N] [--compare]
+
+import sys
+
+sys.path.append("..")
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import timeit
+
+import rtde.rtde as rtde
+import rtde.rtde_config as rtde_config
+from rtde import csv_writer, serialize
+from rtde.rtde_async import AsyncRTDE
+from rtde.rtde_hub import RTDEHub
+from rtde.rtde_mock import MockController
+from rtde.rtde_proxy import RTDEProxy
+from rtde.rtde_stats import LatencyHistogram
+from rtde.rtde_variables import VARIABLES
+
+MAIN_CONFIG = "main-config.xml"
+RESULTS = "benchmark_results.jsonl"
+FREQUENCY = 500
+# Mock controllers served by one RTDEHub, see --robots
+HUB_ROBOTS = 24
+
+
+def wide_recipe(count):
+    """The first count output variables of the mock, vectors first"""
+    names = sorted(
+        (n for n in VARIABLES if not n.startswith("input_")),
+        key=lambda n: (not VARIABLES[n].startswith("VECTOR"), n),
+    )
+    names = names[:count]
+    return names, [VARIABLES[n] for n in names]
+
+
+def recipes():
+    conf = rtde_config.ConfigFile(MAIN_CONFIG)
+    return {
+        "main": conf.get_recipe("state"),
+        "medium": wide_recipe(20),
+        "wide": wide_recipe(45),
+    }
+
+
+def make_config(names, types):
+    config = serialize.DataConfig.unpack_recipe(bytes([1]) + ",".join(types).encode())
+    config.names = names
+    config.compile()
+    return config
+
+
+def sample_state(config):
+    state = config.codec.create_empty(1)
+    for name, data_type in zip(config.names, config.types):
+        size = serialize.get_item_size(data_type)
+        value = 1.5 if data_type.endswith("D") else 1
+        setattr(state, name, [value] * size if size > 1 else value)
+    return state
+
+
+def packet(config):
+    payload = config.pack(sample_state(config))
+    header = struct.pack(">HB", len(payload) + 3, rtde.Command.RTDE_DATA_PACKAGE)
+    return header + payload
+
+
+def rate(func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+    return number / seconds
+
+
+def bench_serialize(quick):
+    number = 5000 if quick else 50000
+    results = {}
+    for label, (names, types) in sorted(recipes().items()):
+        config = make_config(names, types)
+        state = sample_state(config)
+        payload = config.pack(state)
+        results[label + ".fields"] = len(names)
+        results[label + ".pack_per_s"] = rate(lambda: config.pack(state), number)
+        results[label + ".unpack_per_s"] = rate(lambda: config.unpack(payload), number)
+        if rtde.serialize.np is not None:
+            results[label + ".unpack_arrays_per_s"] = rate(
+                lambda: config.unpack_arrays(payload), number
+            )
+        results[label + ".unpack_lazy_per_s"] = rate(
+            lambda: config.unpack_lazy(payload), number
+        )
+        # a control loop reading two fields of the recipe
+        read = names[:2]
+        results[label + ".lazy_two_fields_per_s"] = rate(
+            lambda: [getattr(config.unpack_lazy(payload), n) for n in read], number
+        )
+        view = config.view(read)
+        results[label + ".view_two_fields_per_s"] = rate(
+            lambda: view.unpack(payload), number
+        )
+    return results
+
+
+def offline_connection(config):
+    """An RTDE connection reading from one end of a socket pair"""
+    reader, writer = socket.socketpair()
+    con = rtde.RTDE("localhost")
+    con._RTDE__sock = reader
+    con._RTDE__conn_state = rtde.ConnectionState.STARTED
+    con._RTDE__output_config = config
+    con._RTDE__output_configs = {config.id: config}
+    return con, writer
+
+
+def drain(config, backlog, total, mode):
+    con, writer = offline_connection(config)
+    chunk = packet(config) * backlog
+    rounds = total // backlog
+
+    def feed():
+        for _ in range(rounds):
+            writer.sendall(chunk)
+
+    feeder = threading.Thread(target=feed)
+    start = time.perf_counter()
+    feeder.start()
+    done = 0
+    if mode == "latest":
+        calls = 0
+        while calls + con.skipped_package_count < rounds * backlog:
+            con.receive()
+            calls += 1
+    elif mode == "all":
+        while done < rounds * backlog:
+            done += len(con.receive_all())
+    elif mode == "iter":
+        while done < rounds * backlog:
+            for state in con.iter_packets():
+                done += 1
+    elif mode == "batch":
+        while done < rounds * backlog:
+            done += len(con.receive_batch())
+    else:
+        while done < rounds * backlog:
+            state = con.receive_buffered()
+            while state is not None:
+                done += 1
+                state = con.receive_buffered(buffer_limit=0)
+    seconds = time.perf_counter() - start
+    feeder.join()
+    writer.close()
+    con._RTDE__sock.close()
+    return rounds * backlog / seconds
+
+
+def bench_parse(quick):
+    total = 20000 if quick else 200000
+    results = {}
+    for label, (names, types) in sorted(recipes().items()):
+        config = make_config(names, types)
+        for backlog in (1, 100, 1000):
+            for mode in ("latest", "buffered", "all", "iter", "batch"):
+                if mode == "batch" and rtde.serialize.np is None:
+                    continue
+                key = "%s.backlog_%d.%s_packets_per_s" % (label, backlog, mode)
+                results[key] = drain(config, backlog, total, mode)
+    return results
+
+
+def percentiles(prefix, histogram):
+    return {
+        prefix + ".p50_us": histogram.percentile(50) / 1000.0,
+        prefix + ".p99_us": histogram.percentile(99) / 1000.0,
+        prefix + ".max_us": histogram.max / 1000.0,
+    }
+
+
+def bench_loop(quick):
+    """Control loop against the mock: the loop writes a counter to
+    input_int_register_1 and waits until the mock reports it back."""
+    seconds = 2 if quick else 10
+    names, types = rtde_config.ConfigFile(MAIN_CONFIG).get_recipe("state")
+    with MockController() as mock:
+        con = rtde.RTDE("127.0.0.1", mock.port)
+        con.connect()
+        con.send_output_setup(names + ["input_int_register_1"], [], FREQUENCY)
+        echo = con.send_input_setup(["input_int_register_1"])
+        con.enable_kernel_timestamps()
+        stats = con.enable_stats()
+        con.send_start()
+        round_trip = LatencyHistogram()
+        counter = 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            counter += 1
+            echo.input_int_register_1 = counter
+            sent = time.monotonic_ns()
+            con.send(echo)
+            while con.receive().input_int_register_1 != counter:
+                pass
+            round_trip.record(time.monotonic_ns() - sent)
+        con.send_pause()
+        con.disconnect()
+    results = {"round_trips": round_trip.count}
+    results.update(percentiles("round_trip", round_trip))
+    results.update(percentiles("inter_arrival", stats.inter_arrival))
+    results.update(percentiles("turnaround", stats.turnaround))
+    results.update(percentiles("processing", stats.processing))
+    if stats.kernel_to_user.count:
+        results.update(percentiles("kernel_to_user", stats.kernel_to_user))
+    return results
+
+
+def bench_hub(quick, robots=HUB_ROBOTS):
+    """One RTDEHub loop serving a mock controller per robot. CPU time is that
+    of the thread running the hub, the mocks run in threads of their own."""
+    seconds = 2 if quick else 10
+    names, types = rtde_config.ConfigFile(MAIN_CONFIG).get_recipe("state")
+    mocks = [MockController().__enter__() for _ in range(robots)]
+    hub = RTDEHub()
+    connections = []
+    received = [0]
+
+    def on_state(name, state):
+        received[0] += 1
+
+    try:
+        for i, mock in enumerate(mocks):
+            con = rtde.RTDE("127.0.0.1", mock.port)
+            con.connect()
+            con.send_output_setup(names, types, FREQUENCY)
+            con.send_start()
+            connections.append(con)
+            hub.add("robot%d" % i, con, on_state)
+        # what queued up while the other robots were set up
+        while hub.poll(0):
+            pass
+        before = received[0]
+        start = time.monotonic()
+        cpu_start = time.thread_time()
+        hub.run(seconds)
+        cpu = time.thread_time() - cpu_start
+        elapsed = time.monotonic() - start
+        delivered = received[0] - before
+        # Stop streaming and drain what is in flight, whatever the mocks sent
+        # and the hub never dispatched is missed
+        for mock in mocks:
+            mock.faults.drop_rate = 1.0
+        drain_end = time.monotonic() + 0.5
+        while time.monotonic() < drain_end:
+            hub.poll(0.05)
+        sent = sum(mock.packages_sent for mock in mocks)
+        skipped = sum(hub.stats(name).skipped for name in hub.names())
+    finally:
+        hub.close()
+        for con in connections:
+            con.disconnect()
+        for mock in mocks:
+            mock.stop()
+    return {
+        "robots": robots,
+        "packets_per_s": delivered / elapsed,
+        "delivered_fraction": delivered / (elapsed * FREQUENCY * robots),
+        "missed_packets": sent - received[0],
+        "skipped_packets": skipped,
+        "cpu_percent_per_robot": 100.0 * cpu / elapsed / robots,
+        "cpu_us_per_packet": 1e6 * cpu / max(delivered, 1),
+        "robots_per_core": robots * elapsed / cpu if cpu else 0.0,
+    }
+
+
+def bench_async(quick):
+    sessions = 4
+    seconds = 2 if quick else 10
+    names, types = rtde_config.ConfigFile(MAIN_CONFIG).get_recipe("state")
+
+    async def session(port, counts, index, end):
+        con = AsyncRTDE("127.0.0.1", port)
+        await con.connect()
+        await con.send_output_setup(names, types, FREQUENCY)
+        await con.send_start()
+        async for _ in con.packages():
+            counts[index] += 1
+            if time.monotonic() >= end:
+                break
+        await con.send_pause()
+        con.disconnect()
+
+    async def run_all(port):
+        counts = [0] * sessions
+        end = time.monotonic() + seconds
+        await asyncio.gather(*(session(port, counts, i, end) for i in range(sessions)))
+        return counts
+
+    with MockController() as mock:
+        start = time.monotonic()
+        counts = asyncio.run(run_all(mock.port))
+        elapsed = time.monotonic() - start
+    return {
+        "sessions": sessions,
+        "packets_per_s": sum(counts) / elapsed,
+        "delivered_fraction": sum(counts) / (elapsed * FREQUENCY * sessions),
+    }
+
+
+def bench_proxy(quick):
+    """20 subscribers on one RTDEProxy, plus one that never reads"""
+    subscribers = 20
+    seconds = 2 if quick else 10
+    names, types = rtde_config.ConfigFile(MAIN_CONFIG).get_recipe("state")
+    path = os.path.join(tempfile.mkdtemp(), "rtde.sock")
+    received = [0]
+
+    def on_state(name, state):
+        received[0] += 1
+
+    with MockController() as mock:
+        robot = rtde.RTDE("127.0.0.1", mock.port)
+        robot.connect()
+        proxy = RTDEProxy(robot, path, names, types, FREQUENCY)
+        server = threading.Thread(target=proxy.run)
+        server.start()
+        hub = RTDEHub()
+        clients = []
+        try:
+            for i in range(subscribers + 1):
+                con = rtde.RTDE(path)
+                con.connect()
+                con.send_output_setup(names, types, FREQUENCY)
+                con.send_start()
+                clients.append(con)
+                if i < subscribers:
+                    hub.add(i, con, on_state)
+            start = time.monotonic()
+            hub.run(seconds)
+            elapsed = time.monotonic() - start
+        finally:
+            proxy.stop()
+            server.join()
+            hub.close()
+            for con in clients:
+                con.disconnect()
+            stalled = proxy.clients()[-1] if proxy.clients() else (0, 0)
+            proxy.close()
+            robot.send_pause()
+            robot.disconnect()
+    return {
+        "subscribers": subscribers,
+        "packets_per_s": received[0] / elapsed,
+        "delivered_fraction": received[0] / (elapsed * FREQUENCY * subscribers),
+        "stalled_dropped": stalled[1],
+    }
+
+
+def bench_csv(quick):
+    rows = 2000 if quick else 20000
+    names, types = recipes()["wide"]
+    config = make_config(names, types)
+    state = sample_state(config)
+
+    def write():
+        out = io.StringIO()
+        writer = csv_writer.CSVWriter(out, names, types)
+        writer.writeheader()
+        for _ in range(rows):
+            writer.writerow(state)
+        return out.getvalue()
+
+    text = write()
+    megabytes = len(text) / 1e6
+    results = {"write_MB_per_s": rate(write, 1) * megabytes}
+    try:
+        from rtde import csv_reader
+    except ImportError:
+        return results
+
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+
+    def read():
+        with open(path) as f:
+            csv_reader.CSVReader(f)
+
+    try:
+        results["read_MB_per_s"] = rate(read, 1) * megabytes
+    finally:
+        os.remove(path)
+    return results
+
+
+def bench_config(quick):
+    number = 200 if quick else 2000
+    names, types = recipes()["wide"]
+    fd, path = tempfile.mkstemp(suffix=".xml")
+    with os.fdopen(fd, "w") as f:
+        f.write('<?xml version="1.0"?>\n<rtde_config>\n\t<recipe key="state">\n')
+        for name, data_type in zip(names, types):
+            f.write('\t\t<field name="%s" type="%s"/>\n' % (name, data_type))
+        f.write("\t</recipe>\n</rtde_config>\n")
+    def uncached():
+        rtde_config.clear_cache()
+        return rtde_config.ConfigFile(path)
+
+    def sidecar():
+        rtde_config.clear_cache()
+        return rtde_config.ConfigFile(path, cache_file=True)
+
+    try:
+        return {
+            "main_per_s": rate(lambda: rtde_config.ConfigFile(MAIN_CONFIG), number),
+            "wide_per_s": rate(lambda: rtde_config.ConfigFile(path), number),
+            "wide_uncached_per_s": rate(uncached, number),
+            "wide_sidecar_per_s": rate(sidecar, number),
+        }
+    finally:
+        os.remove(path)
+        if os.path.exists(path + ".cache"):
+            os.remove(path + ".cache")
+
+
+BENCHMARKS = [
+    ("serialize", bench_serialize),
+    ("parse", bench_parse),
+    ("loop", bench_loop),
+    ("hub", bench_hub),
+    ("async", bench_async),
+    ("proxy", bench_proxy),
+    ("csv", bench_csv),
+    ("config", bench_config),
+]
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "--short", "HEAD"])
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1])["results"] if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--quick", action="store_true", help="shorter runs")
+    parser.add_argument("--only", nargs="+", choices=[n for n, _ in BENCHMARKS])
+    parser.add_argument("--output", default=RESULTS)
+    parser.add_argument(
+        "--robots", type=int, default=HUB_ROBOTS, help="robots of the hub benchmark"
+    )
+    parser.add_argument(
+        "--compare", action="store_true", help="show change to the previous record"
+    )
+    args = parser.parse_args()
+
+    previous = previous_results(args.output) if args.compare else None
+    options = {"hub": {"robots": args.robots}}
+    results = {}
+    for name, bench in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        for key, value in sorted(bench(args.quick, **options.get(name, {})).items()):
+            key = name + "." + key
+            results[key] = value
+            line = "%-55s %14.2f" % (key, value)
+            if previous and previous.get(key):
+                line += "  %+7.1f%%" % (100.0 * (value - previous[key]) / previous[key])
+            print(line)
+
+    record = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+    with open(args.output, "a") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# Packets per second through RTDE packet dispatch and data package decoding,
+# without a socket: payloads are fed straight to the parser.
+
+import sys
+
+sys.path.append("..")
+import struct
+import timeit
+
+import rtde.rtde as rtde
+from rtde import serialize
+
+PACKETS = 200000
+
+RECIPES = {
+    "narrow": ["VECTOR6D", "VECTOR6D", "INT32"],
+    "wide": ["VECTOR6D"] * 12 + ["DOUBLE"] * 4 + ["INT32"] * 4 + ["UINT64", "BOOL"],
+}
+
+
+def make_connection(types):
+    config = serialize.DataConfig.unpack_recipe(bytes([1]) + ",".join(types).encode())
+    config.names = ["field_%d" % i for i in range(len(types))]
+    config.compile()
+    con = rtde.RTDE("localhost")
+    con._RTDE__output_config = config
+    con._RTDE__output_configs = {config.id: config}
+    values = []
+    for t in types:
+        values += [1] * serialize.get_item_size(t)
+    payload = memoryview(struct.pack(config.fmt, 1, *values))
+    return con, payload
+
+
+def main():
+    for label, types in sorted(RECIPES.items()):
+        con, payload = make_connection(types)
+        on_packet = con._RTDE__on_packet
+        command = rtde.Command.RTDE_DATA_PACKAGE
+        seconds = min(
+            timeit.repeat(
+                lambda: on_packet(command, payload), number=PACKETS, repeat=3
+            )
+        )
+        print(
+            "%-6s recipe (%4d bytes): %9.0f packets/s"
+            % (label, len(payload), PACKETS / seconds)
+        )
+
+
+if __name__ == "__main__":
+    main()
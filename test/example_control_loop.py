@@ -34,6 +34,7 @@ import rtde.rtde_config as rtde_config
 # logging.basicConfig(level=logging.INFO)
 
 #ROBOT_HOST = '192.168.189.129'
+#ROBOT_HOST = '127.0.0.1'  # local mock: python -m rtde.rtde_mock
 ROBOT_HOST = '169.254.6.28'
 ROBOT_PORT = 30004
 config_filename = "control_loop_configuration.xml"
@@ -71,18 +72,22 @@ setp.input_double_register_5 = 0
 
 # The function "rtde_set_watchdog" in the "rtde_control_loop.urp" creates a 1 Hz watchdog
 watchdog.input_int_register_0 = 0
+# Only send the watchdog when it changes, and every 0.1 s to keep it fed
+con.set_send_policy(
+    rtde.SendPolicy.ON_CHANGE, keepalive=0.1, recipe_id=watchdog.recipe_id
+)
 
 
 def setp_to_list(sp):
     sp_list = []
     for i in range(0, 6):
-        sp_list.append(sp.__dict__["input_double_register_%i" % i])
+        sp_list.append(getattr(sp, "input_double_register_%i" % i))
     return sp_list
 
 
 def list_to_setp(sp, list):
     for i in range(0, 6):
-        sp.__dict__["input_double_register_%i" % i] = list[i]
+        setattr(sp, "input_double_register_%i" % i, list[i])
     return sp
 
 
@@ -100,13 +105,14 @@ while keep_running:
         break
 
     # do something...
+    new_setpoint = False
     if move_completed and state.output_int_register_0 == 1:
         move_completed = False
         new_setp = setp1 if setp_to_list(setp) == setp2 else setp2
         list_to_setp(setp, new_setp)
         print("New pose = " + str(new_setp))
-        # send new setpoint
-        con.send(setp)
+        # send new setpoint together with the watchdog kick
+        new_setpoint = True
         watchdog.input_int_register_0 = 1
     elif not move_completed and state.output_int_register_0 == 0:
         print("Move to confirmed pose = " + str(state.target_q))
@@ -114,7 +120,10 @@ while keep_running:
         watchdog.input_int_register_0 = 0
 
     # kick watchdog
-    con.send(watchdog)
+    if new_setpoint:
+        con.send_many([setp, watchdog])
+    else:
+        con.send(watchdog)
 
 con.send_pause()
 
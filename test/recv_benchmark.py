@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Compares the bytes copied in user space per received data package for the
+# old concatenate-and-slice receive path and the in-place ReceiveBuffer.
+#
+# A backlog of data packages for a wide output recipe is pushed through a
+# local socket pair, the same way a 500 Hz controller stream arrives.
+
+import sys
+
+sys.path.append("..")
+import socket
+import struct
+import threading
+
+from rtde.rtde import ReceiveBuffer, Command
+
+FREQUENCY = 500
+SECONDS = 10
+OLD_RECV_SIZE = 4096
+
+# 12 x VECTOR6D, 4 x DOUBLE, 4 x INT32, UINT64 and BOOL
+WIDE_RECIPE_FMT = ">B" + "d" * 72 + "d" * 4 + "i" * 4 + "Q?"
+
+
+def make_stream(count):
+    payload_size = struct.calcsize(WIDE_RECIPE_FMT)
+    header = struct.pack(">HB", payload_size + 3, Command.RTDE_DATA_PACKAGE)
+    packet = header + bytes(payload_size)
+    return packet * count, len(packet)
+
+
+def old_path_copies(stream, backlog):
+    """Replays the old buffer arithmetic and counts the bytes it copies.
+
+    backlog is the number of bytes available in the socket per read burst,
+    one packet for a loop that keeps up, the whole stream after a stall.
+    """
+    copied = 0
+    buf_len = 0
+    position = 0
+    while position < len(stream):
+        burst_end = min(position + backlog, len(stream))
+        while position < burst_end:
+            more = min(OLD_RECV_SIZE, burst_end - position)
+            # self.__buf = self.__buf + more
+            copied += buf_len + more
+            buf_len += more
+            position += more
+        while buf_len >= 3:
+            size = struct.unpack_from(">H", stream, position - buf_len)[0]
+            if buf_len < size:
+                break
+            # packet, self.__buf = self.__buf[3:size], self.__buf[size:]
+            copied += (size - 3) + (buf_len - size)
+            buf_len -= size
+    return copied
+
+
+def new_path_copies(stream, backlog):
+    buf = ReceiveBuffer()
+    reader, writer = socket.socketpair()
+
+    def feed():
+        for i in range(0, len(stream), backlog):
+            writer.sendall(stream[i : i + backlog])
+        writer.close()
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    packets = 0
+    while True:
+        if not buf.full and buf.fill(reader) == 0:
+            break
+        packet = buf.next_packet()
+        while packet is not None:
+            struct.unpack_from(WIDE_RECIPE_FMT, packet[1])
+            packets += 1
+            packet = buf.next_packet()
+    feeder.join()
+    reader.close()
+    return buf.copied_bytes, packets
+
+
+def main():
+    count = FREQUENCY * SECONDS
+    stream, packet_size = make_stream(count)
+    print(
+        "%d packages of %d bytes (%d Hz for %d s)"
+        % (count, packet_size, FREQUENCY, SECONDS)
+    )
+    for label, backlog in [
+        ("steady state", packet_size),
+        ("100 ms stall", packet_size * FREQUENCY // 10),
+        ("full backlog", len(stream)),
+    ]:
+        old = old_path_copies(stream, backlog)
+        new, packets = new_path_copies(stream, backlog)
+        assert packets == count
+        print(
+            "%-14s old: %10.1f bytes/package  new: %8.1f bytes/package"
+            % (label, float(old) / count, float(new) / count)
+        )
+
+
+if __name__ == "__main__":
+    main()
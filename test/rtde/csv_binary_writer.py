@@ -40,63 +40,15 @@ class CSVBinaryWriter(object):
         self.__header_names = []
         self.__columns = 0
         for i in range(len(self.__names)):
-            size = serialize.get_item_size(self.__types[i])
-            self.__columns += size
-            if size > 1:
-                for j in range(size):
-                    name = self.__names[i] + "_" + str(j)
-                    self.__header_names.append(name)
-            else:
-                name = self.__names[i]
-                self.__header_names.append(name)
+            field_type = serialize.get_field_type(self.__types[i])
+            self.__columns += field_type.count
+            self.__header_names.extend(field_type.columns(self.__names[i]))
 
     def getType(self, vtype):
-        if vtype == "VECTOR3D":
-            return "DOUBLE" + self.__delimiter + "DOUBLE" + self.__delimiter + "DOUBLE"
-        elif vtype == "VECTOR6D":
-            return (
-                "DOUBLE"
-                + self.__delimiter
-                + "DOUBLE"
-                + self.__delimiter
-                + "DOUBLE"
-                + self.__delimiter
-                + "DOUBLE"
-                + self.__delimiter
-                + "DOUBLE"
-                + self.__delimiter
-                + "DOUBLE"
-            )
-        elif vtype == "VECTOR6INT32":
-            return (
-                "INT32"
-                + self.__delimiter
-                + "INT32"
-                + self.__delimiter
-                + "INT32"
-                + self.__delimiter
-                + "INT32"
-                + self.__delimiter
-                + "INT32"
-                + self.__delimiter
-                + "INT32"
-            )
-        elif vtype == "VECTOR6UINT32":
-            return (
-                "UINT32"
-                + self.__delimiter
-                + "UINT32"
-                + self.__delimiter
-                + "UINT32"
-                + self.__delimiter
-                + "UINT32"
-                + self.__delimiter
-                + "UINT32"
-                + self.__delimiter
-                + "UINT32"
-            )
-        else:
+        field_type = serialize.TYPES.get(vtype)
+        if field_type is None:
             return str(vtype)
+        return self.__delimiter.join([field_type.element] * field_type.count)
 
     def writeheader(self):
         # Header names
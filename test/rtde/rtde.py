@@ -21,22 +21,37 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import collections
 import struct
 import socket
 import select
 import sys
 import logging
+import threading
+import time
 
 if sys.version_info[0] < 3:
     import serialize
+    import rtde_stats
 else:
     from rtde import serialize
+    from rtde import rtde_stats
 
 DEFAULT_TIMEOUT = 1.0
+RECV_BUFFER_SIZE = 1 << 20
+MIN_RECV_SIZE = 4096
+# Packages kept per output recipe while receive() waits for another recipe
+RECIPE_QUEUE_SIZE = 1024
 
 LOGNAME = "rtde"
 _log = logging.getLogger(LOGNAME)
 
+_header = struct.Struct(">HB")
+
+# Linux only, not exported by the socket module
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+_timespec = struct.Struct("@ll")
+
 
 class Command:
     RTDE_REQUEST_PROTOCOL_VERSION = 86  # ascii V
@@ -60,6 +75,11 @@ class ConnectionState:
     PAUSED = 3
 
 
+class SendPolicy:
+    ALWAYS = 0  # send every package
+    ON_CHANGE = 1  # skip packages equal to the last one sent, see keepalive
+
+
 class RTDEException(Exception):
     def __init__(self, msg):
         self.msg = msg
@@ -73,29 +93,176 @@ class RTDETimeoutException(RTDEException):
         super(RTDETimeoutException, self).__init__(msg)
 
 
+class ReceiveBuffer(object):
+    """Preallocated receive buffer filled in place with socket.recv_into.
+
+    Packets are returned as memoryview slices into the buffer and are only
+    valid until the next call to fill().
+    """
+
+    def __init__(self, size=RECV_BUFFER_SIZE):
+        self.__buf = bytearray(size)
+        self.__view = memoryview(self.__buf)
+        self.__start = 0
+        self.__end = 0
+        # __end before the latest fill, -1 once everything was consumed
+        self.__fresh = -1
+        self.copied_bytes = 0
+
+    def __len__(self):
+        return self.__end - self.__start
+
+    @property
+    def full(self):
+        return len(self.__buf) - (self.__end - self.__start) < MIN_RECV_SIZE
+
+    def clear(self):
+        self.__start = 0
+        self.__end = 0
+        self.__fresh = -1
+
+    def reserve(self):
+        """Return a writable view of the free space at the tail."""
+        if len(self.__buf) - self.__end < MIN_RECV_SIZE:
+            self.__compact()
+        return self.__view[self.__end :]
+
+    def commit(self, received):
+        self.__fresh = self.__end
+        self.__end += received
+
+    def fill(self, sock):
+        received = sock.recv_into(self.reserve())
+        self.__fresh = self.__end
+        self.__end += received
+        return received
+
+    def fill_timestamped(self, sock):
+        """fill() through recvmsg on a socket with SO_TIMESTAMPNS enabled.
+        Returns (received, kernel receive time in ns since the epoch), the
+        time is None if the kernel did not attach one.
+        """
+        received, ancdata, _, _ = sock.recvmsg_into(
+            [self.reserve()], socket.CMSG_SPACE(_timespec.size)
+        )
+        self.__fresh = self.__end
+        self.__end += received
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                seconds, nanoseconds = _timespec.unpack_from(data)
+                return received, seconds * 1000000000 + nanoseconds
+        return received, None
+
+    def consumed_fresh(self):
+        """True if the packet returned last by next_packet() was completed
+        by the latest fill, i.e. arrived with that read."""
+        return self.__start > self.__fresh
+
+    def unread(self):
+        """Return a view of the received bytes not yet returned as packets."""
+        return self.__view[self.__start : self.__end]
+
+    def peek_command(self):
+        if self.__end - self.__start < 3:
+            return None
+        return self.__buf[self.__start + 2]
+
+    def peek_recipe_id(self):
+        if self.__end - self.__start < 4:
+            return None
+        return self.__buf[self.__start + 3]
+
+    def next_packet(self):
+        """Return (command, payload) of the next complete packet or None."""
+        available = self.__end - self.__start
+        if available < 3:
+            return None
+        size, command = _header.unpack_from(self.__buf, self.__start)
+        if size < 3:
+            # The size includes the header, anything smaller never advances
+            raise RTDEException("Invalid packet size %d" % size)
+        if available < size:
+            return None
+        payload = self.__view[self.__start + 3 : self.__start + size]
+        self.__start += size
+        if self.__start == self.__end:
+            self.__start = self.__end = 0
+            self.__fresh = -1
+        return command, payload
+
+    def __compact(self):
+        # Only the unconsumed tail (usually a partial packet) is moved
+        remaining = self.__end - self.__start
+        self.__buf[:remaining] = self.__buf[self.__start : self.__end]
+        self.copied_bytes += 2 * remaining
+        self.__start = 0
+        self.__end = remaining
+
+
 class RTDE(object):
     def __init__(self, hostname, port=30004):
         self.hostname = hostname
         self.port = port
+        # Wait for the socket to become writable before each send. Can be
+        # turned off for a socket that is known to be healthy, a blocked
+        # send then fails after DEFAULT_TIMEOUT instead.
+        self.select_on_send = True
         self.__conn_state = ConnectionState.DISCONNECTED
         self.__sock = None
         self.__output_config = None
+        self.__output_configs = {}
+        self.__recipe_queues = {}
         self.__input_config = {}
+        self.__input_frames = {}
+        self.__send_policy = (SendPolicy.ALWAYS, None)
+        self.__send_policies = {}
+        self.__last_sent = {}
+        self.__unchanged_send_count = 0
+        self.__kernel_timestamps = False
+        self.__arrival_ns = None
         self.__skipped_package_count = 0
         self.__protocolVersion = RTDE_PROTOCOL_VERSION_1
+        self.__buf = ReceiveBuffer()
+        self.__next_packet = self.__buf.next_packet
+        self.__stats = None
+        self.__recv_lock = threading.Lock()
+        self.__receiver = None
+        self.__capture = None
+        self.__publisher = None
+        # __data_handler is what data packages are dispatched to: the
+        # registered handler, or the publisher wrapping it
+        self.__data_handler = self.__unpack_data_package
+        self.__handlers = {
+            Command.RTDE_REQUEST_PROTOCOL_VERSION: self.__unpack_protocol_version_package,
+            Command.RTDE_GET_URCONTROL_VERSION: self.__unpack_urcontrol_version_package,
+            Command.RTDE_TEXT_MESSAGE: self.__unpack_text_message,
+            Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS: self.__unpack_setup_outputs_package,
+            Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS: self.__unpack_setup_inputs_package,
+            Command.RTDE_CONTROL_PACKAGE_START: self.__unpack_start_package,
+            Command.RTDE_CONTROL_PACKAGE_PAUSE: self.__unpack_pause_package,
+            Command.RTDE_DATA_PACKAGE: self.__unpack_data_package,
+        }
 
     def connect(self):
         if self.__sock:
             return
 
-        self.__buf = b""  # buffer data in binary format
+        self.__buf.clear()
+        if self.__capture is not None:
+            self.__capture.write_session()
         try:
-            self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.__sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.hostname.startswith("/"):
+                # Unix domain socket path, e.g. of an rtde_proxy.RTDEProxy
+                self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                address = self.hostname
+            else:
+                self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.__sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                address = (self.hostname, self.port)
             self.__sock.settimeout(DEFAULT_TIMEOUT)
             self.__skipped_package_count = 0
-            self.__sock.connect((self.hostname, self.port))
+            self.__sock.connect(address)
             self.__conn_state = ConnectionState.CONNECTED
         except (socket.timeout, socket.error):
             self.__sock = None
@@ -104,6 +271,9 @@ class RTDE(object):
             raise RTDEException("Unable to negotiate protocol version")
 
     def disconnect(self):
+        self.stop_receiver()
+        if self.__capture is not None:
+            self.__capture.flush()
         if self.__sock:
             self.__sock.close()
             self.__sock = None
@@ -155,10 +325,20 @@ class RTDE(object):
             )
             return None
         result.names = variables
+        codec = result.compile()
         self.__input_config[result.id] = result
-        return serialize.DataObject.create_empty(variables, result.id)
+        # Reusable data package with the constant header and recipe id
+        frame = bytearray(3 + codec.size)
+        _header.pack_into(frame, 0, len(frame), Command.RTDE_DATA_PACKAGE)
+        frame[3] = result.id
+        self.__input_frames[result.id] = frame
+        return codec.create_empty(result.id)
 
     def send_output_setup(self, variables, types=[], frequency=125):
+        """Set up an output recipe and return its recipe id, or False.
+        May be called several times, every recipe is streamed at its own
+        frequency and data packages carry the id in recipe_id.
+        """
         cmd = Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS
         payload = struct.pack(">d", frequency)
         payload = payload + (",".join(variables).encode("utf-8"))
@@ -172,8 +352,33 @@ class RTDE(object):
             )
             return False
         result.names = variables
+        result.compile()
         self.__output_config = result
-        return True
+        self.__output_configs[result.id] = result
+        self.__recipe_queues[result.id] = collections.deque(maxlen=RECIPE_QUEUE_SIZE)
+        if self.__capture is not None:
+            self.__capture.write_recipe(result)
+        return result.id
+
+    def get_output_config(self, recipe_id=None):
+        """DataConfig of an output recipe, the last one set up by default"""
+        if recipe_id is None:
+            return self.__output_config
+        return self.__output_configs.get(recipe_id)
+
+    def view(self, names=None, recipe_id=None):
+        """Return a serialize.RecipeView decoding only the given fields of an
+        output recipe, all fields if names is None. Views do not receive,
+        decode the frames of receive(binary=True) with view.unpack(), e.g.
+        a control loop view and a full logging view from the same frame.
+        """
+        config = self.get_output_config(recipe_id)
+        if config is None:
+            raise RTDEException("Output configuration not initialized")
+        return config.view(names)
+
+    def get_input_config(self, recipe_id):
+        return self.__input_config.get(recipe_id)
 
     def send_start(self):
         cmd = Command.RTDE_CONTROL_PACKAGE_START
@@ -186,6 +391,7 @@ class RTDE(object):
         return success
 
     def send_pause(self):
+        self.stop_receiver()
         cmd = Command.RTDE_CONTROL_PACKAGE_PAUSE
         success = self.__sendAndReceive(cmd)
         if success:
@@ -203,19 +409,255 @@ class RTDE(object):
             _log.error("Input configuration id not found: " + str(input_data.recipe_id))
             return
         config = self.__input_config[input_data.recipe_id]
-        return self.__sendall(Command.RTDE_DATA_PACKAGE, config.pack(input_data))
+        frame = self.__input_frames[input_data.recipe_id]
+        config.codec.pack_values_into(frame, 4, input_data)
+        if self.__unchanged(input_data.recipe_id, frame):
+            return True
+        sent = self.__send_frame(frame)
+        if sent:
+            self.__record_sent(input_data.recipe_id, frame)
+        return sent
 
-    def receive(self, binary=False):
+    def send_many(self, input_data_list):
+        """Send several input packages with a single sendall.
+        The packages are written back to back in the given order, so the
+        controller sees them in the same cycle where possible.
+        """
+        if self.__conn_state != ConnectionState.STARTED:
+            _log.error("Cannot send when RTDE synchronization is inactive")
+            return
+        for input_data in input_data_list:
+            if not input_data.recipe_id in self.__input_config:
+                _log.error(
+                    "Input configuration id not found: " + str(input_data.recipe_id)
+                )
+                return
+        buf = bytearray()
+        frames = []
+        for input_data in input_data_list:
+            config = self.__input_config[input_data.recipe_id]
+            frame = self.__input_frames[input_data.recipe_id]
+            config.codec.pack_values_into(frame, 4, input_data)
+            if not self.__unchanged(input_data.recipe_id, frame):
+                buf += frame
+                frames.append((input_data.recipe_id, bytes(frame)))
+        if not frames:
+            return True
+        sent = self.__send_frame(buf, len(frames))
+        if sent:
+            for recipe_id, frame in frames:
+                self.__record_sent(recipe_id, frame)
+        return sent
+
+    def set_send_policy(self, policy, keepalive=None, recipe_id=None):
+        """Choose when send() and send_many() actually send a package.
+        With SendPolicy.ON_CHANGE a package equal to the last one sent for
+        its recipe is skipped, unless keepalive seconds have passed since,
+        e.g. to keep feeding a watchdog register. Applies to one input
+        recipe, or to all recipes without their own policy if recipe_id is
+        None.
+        """
+        if recipe_id is None:
+            self.__send_policy = (policy, keepalive)
+        else:
+            self.__send_policies[recipe_id] = (policy, keepalive)
+
+    def changed_fields(self, input_data):
+        """Names of the fields that differ from the package last sent for
+        this recipe under SendPolicy.ON_CHANGE, all names if none was sent.
+        """
+        config = self.__input_config[input_data.recipe_id]
+        last = self.__last_sent.get(input_data.recipe_id)
+        if last is None:
+            return list(config.names)
+        sent = config.codec.unpack(last[0][3:]).to_tuple()
+        return [
+            name
+            for name, old, new in zip(config.names, sent, input_data.to_tuple())
+            if old != new
+        ]
+
+    @property
+    def unchanged_send_count(self):
+        """Packages skipped by SendPolicy.ON_CHANGE"""
+        return self.__unchanged_send_count
+
+    def __unchanged(self, recipe_id, frame):
+        policy, keepalive = self.__send_policies.get(recipe_id, self.__send_policy)
+        if policy == SendPolicy.ALWAYS:
+            return False
+        # Compare the packed frames, this also catches vectors changed in place
+        last = self.__last_sent.get(recipe_id)
+        if (
+            last is not None
+            and last[0] == frame
+            and (keepalive is None or time.monotonic() - last[1] < keepalive)
+        ):
+            self.__unchanged_send_count += 1
+            return True
+        return False
+
+    def __record_sent(self, recipe_id, frame):
+        # Only frames that reached the socket count as sent
+        policy, _ = self.__send_policies.get(recipe_id, self.__send_policy)
+        if policy != SendPolicy.ALWAYS:
+            self.__last_sent[recipe_id] = (bytes(frame), time.monotonic())
+
+    def receive(self, binary=False, recipe_id=None):
         """Recieve the latest data package.
         If muliple packages has been received, older ones are discarded
         and only the newest one will be returned. Will block untill a package
         is received or the connection is lost
+        With several output recipes, recipe_id selects the recipe to wait
+        for, as returned by send_output_setup(). Packages of the other
+        recipes are kept for their own receive() calls. Without recipe_id
+        the next package of any recipe is returned.
         """
         if self.__output_config is None:
             raise RTDEException("Output configuration not initialized")
         if self.__conn_state != ConnectionState.STARTED:
             raise RTDEException("Cannot receive when RTDE synchronization is inactive")
-        return self.__recv(Command.RTDE_DATA_PACKAGE, binary)
+        with self.__recv_lock:
+            if recipe_id is None:
+                data = self.__recv(Command.RTDE_DATA_PACKAGE, binary)
+                fresh = self.__buf.consumed_fresh()
+            else:
+                # queued packages may come from any earlier read
+                data = self.__recv_recipe(recipe_id, binary)
+                fresh = False
+        if self.__stats is not None and data is not None:
+            self.__stats.on_receive()
+            if self.__arrival_ns is not None and fresh and not binary:
+                timestamp = getattr(data, "timestamp", None)
+                if timestamp is not None:
+                    self.__stats.on_controller_timestamp(timestamp, self.__arrival_ns)
+        return data
+
+    def enable_kernel_timestamps(self):
+        """Have the kernel timestamp every read (SO_TIMESTAMPNS, Linux).
+        arrival_ns then holds the time the latest read reached the socket,
+        and enabled stats record the kernel to Python delay and, for
+        packages that arrived with the latest read, the controller jitter.
+        Returns False if not supported. Call after connect().
+        """
+        if not sys.platform.startswith("linux") or self.__sock is None:
+            _log.error("Kernel timestamps need a connected socket on Linux")
+            return False
+        self.__sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        self.__kernel_timestamps = True
+        return True
+
+    @property
+    def arrival_ns(self):
+        """Kernel receive time (ns since the epoch, time.time_ns() clock) of
+        the latest read, None unless enable_kernel_timestamps() was called.
+        """
+        return self.__arrival_ns
+
+    def enable_stats(self):
+        """Start collecting timing and traffic statistics.
+        Returns the rtde_stats.SessionStats object, which can be read at any
+        time while the loop keeps running.
+        """
+        if self.__stats is None:
+            self.__stats = rtde_stats.SessionStats()
+            self.__stats.attach_gc()
+            self.__next_packet = self.__instrumented_next_packet
+        return self.__stats
+
+    def disable_stats(self):
+        if self.__stats is not None:
+            self.__stats.detach_gc()
+            self.__stats = None
+        self.__next_packet = self.__buf.next_packet
+
+    @property
+    def stats(self):
+        """The SessionStats of this session, None unless enabled"""
+        return self.__stats
+
+    def start_capture(self, file):
+        """Append everything received from now on to a capture file, which
+        rtde_capture.Replay can play back. file is a filename or a binary
+        file object. Returns the rtde_capture.CaptureWriter.
+        """
+        # rtde_capture imports this module
+        from rtde import rtde_capture
+
+        self.stop_capture()
+        self.__capture = rtde_capture.CaptureWriter(file)
+        self.__capture.write_session()
+        for config in self.__output_configs.values():
+            self.__capture.write_recipe(config)
+        if len(self.__buf):
+            self.__capture.write_stream(self.__buf.unread())
+        return self.__capture
+
+    def stop_capture(self):
+        capture, self.__capture = self.__capture, None
+        if capture is not None:
+            capture.close()
+
+    def start_publisher(self, name, recipe_id=None):
+        """Copy every data package of an output recipe that this connection
+        decodes into the shared memory block name, where other processes
+        can read it with rtde_shm.SharedStateReader. Defaults to the last
+        output recipe set up. Returns the rtde_shm.SharedStatePublisher.
+        """
+        from rtde import rtde_shm
+
+        if self.__output_config is None:
+            raise RTDEException("Output configuration not initialized")
+        self.stop_publisher()
+        config = self.__output_config
+        if recipe_id is not None:
+            config = self.__output_configs[recipe_id]
+        self.__publisher = rtde_shm.SharedStatePublisher(name, config)
+        self.__data_handler = self.__publish_data_package
+        return self.__publisher
+
+    def stop_publisher(self):
+        """Stop publishing and remove the shared memory block"""
+        if self.__publisher is not None:
+            publisher = self.__publisher
+            self.__publisher = None
+            self.__data_handler = self.__handlers[Command.RTDE_DATA_PACKAGE]
+            publisher.close()
+
+    def __publish_data_package(self, payload):
+        # Looks the handler up per package, so a handler registered while
+        # publishing (e.g. by set_lazy_decoding) is wrapped as well
+        publisher = self.__publisher
+        if payload[0] == publisher.config.id:
+            publisher.publish(payload)
+        return self.__handlers[Command.RTDE_DATA_PACKAGE](payload)
+
+    def start_receiver(self):
+        """Start a background thread that keeps receiving and publishes the
+        newest state to a StateMailbox, which is returned.
+        While it runs, consumers read the mailbox instead of calling
+        receive(). It is stopped by send_pause() and disconnect().
+        """
+        if self.__receiver is None or not self.__receiver.is_alive():
+            self.__receiver = BackgroundReceiver(self)
+            self.__receiver.start()
+        return self.__receiver.mailbox
+
+    def stop_receiver(self):
+        receiver, self.__receiver = self.__receiver, None
+        if receiver is not None:
+            receiver.stop()
+
+    @property
+    def receive_lock(self):
+        """The lock held by receive(), receive_all() and the request/reply
+        commands such as send_start()"""
+        return self.__recv_lock
+
+    @property
+    def mailbox(self):
+        """The StateMailbox of the background receiver, None if not started"""
+        return self.__receiver.mailbox if self.__receiver else None
 
     def receive_buffered(self, binary=False, buffer_limit=None):
         """Recieve the next data package.
@@ -224,7 +666,7 @@ class RTDE(object):
         Returns None if no data is available.
         """
 
-        if self._RTDE__output_config is None:
+        if self.__output_config is None:
             logging.error("Output configuration not initialized")
             return None
 
@@ -232,6 +674,7 @@ class RTDE(object):
             while (
                 self.is_connected()
                 and (buffer_limit == None or len(self.__buf) < buffer_limit)
+                and not self.__buf.full
                 and self.__recv_to_buffer(0)
             ):
                 pass
@@ -244,6 +687,108 @@ class RTDE(object):
 
         return data
 
+    def receive_all(self, binary=False, last=None):
+        """Recieve every data package available now, oldest first.
+        Reads whatever is available without blocking and parses it in one
+        pass. With last, only the newest last packages are decoded and the
+        older ones are counted as skipped. Returns an empty list if no data
+        is available.
+        The list keeps every decoded state alive at once, up to a receive
+        buffer full (about 1000 packages of a wide recipe), so a deep
+        backlog drains up to 40% slower than with a receive_buffered() loop,
+        which reuses the memory of the state it just dropped. Consumers that
+        handle one package at a time should iterate over iter_packets()
+        instead, or use receive_batch() for NumPy arrays.
+        """
+        with self.__recv_lock:
+            return list(self.iter_packets(binary, last))
+
+    def iter_packets(self, binary=False, last=None):
+        """Generator version of receive_all().
+        Packages are decoded as they are consumed, which drains a backlog
+        about as fast as a receive_buffered() loop. Do not call other receive methods before
+        the generator is exhausted, the packages point into the receive
+        buffer until then. Hold receive_lock while iterating if other
+        threads may receive on this connection.
+        """
+        if self.__output_config is None:
+            raise RTDEException("Output configuration not initialized")
+
+        try:
+            while (
+                self.is_connected()
+                and not self.__buf.full
+                and self.__recv_to_buffer(0)
+            ):
+                pass
+        except RTDEException as e:
+            if len(self.__buf) == 0:
+                raise e
+
+        # Older packages fall out of the deque without being decoded
+        payloads = collections.deque(maxlen=last)
+        received = 0
+        packet = self.__next_packet()
+        while packet is not None:
+            command, payload = packet
+            if command == Command.RTDE_DATA_PACKAGE:
+                payloads.append(payload)
+                received += 1
+            else:
+                self.__on_packet(command, payload)
+            packet = self.__next_packet()
+        self.__skipped_package_count += received - len(payloads)
+
+        for payload in payloads:
+            if binary:
+                yield self.__binary_package(payload)
+            else:
+                yield self.__data_handler(payload)
+
+    def receive_batch(self, max_packets=None, recipe_id=None):
+        """Recieve all buffered data packages as a NumPy structured array.
+        Reads whatever is available without blocking and decodes up to
+        max_packets data packages in one step. The dtype follows the output
+        recipe, vectors are (n,) subarrays. Returns an empty array if no
+        data is available.
+        recipe_id is required with several output recipes, packages of the
+        other recipes are kept for receive(recipe_id=...).
+        """
+        if self.__output_config is None:
+            raise RTDEException("Output configuration not initialized")
+        if recipe_id is None:
+            if len(self.__output_configs) > 1:
+                raise RTDEException("recipe_id required with several output recipes")
+            recipe_id = self.__output_config.id
+
+        try:
+            while (
+                self.is_connected()
+                and not self.__buf.full
+                and self.__recv_to_buffer(0)
+            ):
+                pass
+        except RTDEException as e:
+            if len(self.__buf) == 0:
+                raise e
+
+        queue = self.__recipe_queues.get(recipe_id)
+        payloads = []
+        while queue and (max_packets is None or len(payloads) < max_packets):
+            payloads.append(queue.popleft())
+        while max_packets is None or len(payloads) < max_packets:
+            packet = self.__next_packet()
+            if packet is None:
+                break
+            command, payload = packet
+            if command != Command.RTDE_DATA_PACKAGE:
+                self.__on_packet(command, payload)
+            elif payload[0] == recipe_id:
+                payloads.append(payload)
+            else:
+                self.__queue_package(payload)
+        return self.__output_configs[recipe_id].unpack_batch(payloads)
+
     def send_message(
         self, message, source="Python Client", type=serialize.Message.INFO_MESSAGE
     ):
@@ -252,48 +797,86 @@ class RTDE(object):
         payload = struct.pack(fmt, len(message), message, len(source), source, type)
         return self.__sendall(cmd, payload)
 
-    def __on_packet(self, cmd, payload):
-        if cmd == Command.RTDE_REQUEST_PROTOCOL_VERSION:
-            return self.__unpack_protocol_version_package(payload)
-        elif cmd == Command.RTDE_GET_URCONTROL_VERSION:
-            return self.__unpack_urcontrol_version_package(payload)
-        elif cmd == Command.RTDE_TEXT_MESSAGE:
-            return self.__unpack_text_message(payload)
-        elif cmd == Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS:
-            return self.__unpack_setup_outputs_package(payload)
-        elif cmd == Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS:
-            return self.__unpack_setup_inputs_package(payload)
-        elif cmd == Command.RTDE_CONTROL_PACKAGE_START:
-            return self.__unpack_start_package(payload)
-        elif cmd == Command.RTDE_CONTROL_PACKAGE_PAUSE:
-            return self.__unpack_pause_package(payload)
-        elif cmd == Command.RTDE_DATA_PACKAGE:
-            return self.__unpack_data_package(payload, self.__output_config)
+    def set_lazy_decoding(self, lazy=True):
+        """Return data packages whose fields are decoded on first access.
+        Worth it for wide recipes of which only a few fields are read, and
+        for packages that are received but mostly not looked at.
+        """
+        if lazy:
+            handler = self.__unpack_lazy_data_package
         else:
-            _log.error("Unknown package command: " + str(cmd))
+            handler = self.__unpack_data_package
+        self.register_handler(Command.RTDE_DATA_PACKAGE, handler)
 
-    def __sendAndReceive(self, cmd, payload=b""):
-        if self.__sendall(cmd, payload):
-            return self.__recv(cmd)
+    def set_vector_arrays(self, arrays=True):
+        """Return vector fields as read-only NumPy arrays instead of lists,
+        for vectorized math on them (e.g. numpy.linalg.norm of a force)
+        without a Python float per element. Requires NumPy. Replaces
+        set_lazy_decoding() and the other way around.
+        """
+        if arrays:
+            if serialize.np is None:
+                raise ImportError("NumPy is required for vector arrays")
+            handler = self.__unpack_array_data_package
         else:
+            handler = self.__unpack_data_package
+        self.register_handler(Command.RTDE_DATA_PACKAGE, handler)
+
+    def register_handler(self, command, handler):
+        """Install handler(payload) for a package command and return the
+        previous handler, so it can be chained.
+        The payload is a memoryview into the receive buffer that is only
+        valid during the call. The handler's return value is what receive()
+        or the matching control request returns. Text messages can be
+        decoded with serialize.Message.unpack(bytes(payload)).
+        """
+        previous = self.__handlers.get(command)
+        self.__handlers[command] = handler
+        if command == Command.RTDE_DATA_PACKAGE and self.__publisher is None:
+            self.__data_handler = handler
+        return previous
+
+    def __on_packet(self, cmd, payload):
+        # Data packages are by far the most frequent, check them first
+        if cmd == Command.RTDE_DATA_PACKAGE:
+            return self.__data_handler(payload)
+        handler = self.__handlers.get(cmd)
+        if handler is None:
+            _log.error("Unknown package command: " + str(cmd))
             return None
+        return handler(payload)
+
+    def __sendAndReceive(self, cmd, payload=b""):
+        # Hold off the background receiver until the reply has been read
+        with self.__recv_lock:
+            if self.__sendall(cmd, payload):
+                return self.__recv(cmd)
+            else:
+                return None
 
     def __sendall(self, command, payload=b""):
-        fmt = ">HB"
-        size = struct.calcsize(fmt) + len(payload)
-        buf = struct.pack(fmt, size, command) + payload
+        return self.__send_frame(_header.pack(3 + len(payload), command) + payload)
 
+    def __send_frame(self, frame, packets=1):
         if self.__sock is None:
             _log.error("Unable to send: not connected to Robot")
             return False
 
-        _, writable, _ = select.select([], [self.__sock], [], DEFAULT_TIMEOUT)
-        if len(writable):
-            self.__sock.sendall(buf)
-            return True
-        else:
-            self.__trigger_disconnected()
-            return False
+        if self.select_on_send:
+            _, writable, _ = select.select([], [self.__sock], [], DEFAULT_TIMEOUT)
+            if self.__stats is not None:
+                self.__stats.on_select()
+            if not len(writable):
+                self.__trigger_disconnected()
+                return False
+        self.__sock.sendall(frame)
+        if self.__stats is not None:
+            self.__stats.on_send(len(frame), packets)
+        return True
+
+    def fileno(self):
+        """Socket file descriptor, for use with select/selectors"""
+        return self.__sock.fileno()
 
     def has_data(self):
         timeout = 0
@@ -307,47 +890,98 @@ class RTDE(object):
             except RTDETimeoutException:
                 return None
 
-            # unpack_from requires a buffer of at least 3 bytes
-            while len(self.__buf) >= 3:
-                # Attempts to extract a packet
-                packet_header = serialize.ControlHeader.unpack(self.__buf)
-
-                if len(self.__buf) >= packet_header.size:
-                    packet, self.__buf = (
-                        self.__buf[3 : packet_header.size],
-                        self.__buf[packet_header.size :],
+            while True:
+                packet = self.__next_packet()
+                if packet is None:
+                    break
+                packet_command, payload = packet
+                if (
+                    command == Command.RTDE_DATA_PACKAGE
+                    and packet_command == command
+                    and self.__buf.peek_command() == command
+                    and (
+                        len(self.__output_configs) < 2
+                        or self.__buf.peek_recipe_id() == payload[0]
                     )
-                    data = self.__on_packet(packet_header.command, packet)
-                    if len(self.__buf) >= 3 and command == Command.RTDE_DATA_PACKAGE:
-                        next_packet_header = serialize.ControlHeader.unpack(self.__buf)
-                        if next_packet_header.command == command:
-                            _log.debug("skipping package(1)")
-                            self.__skipped_package_count += 1
-                            continue
-                    if packet_header.command == command:
-                        if binary:
-                            return packet[1:]
-
-                        return data
-                    else:
-                        _log.debug("skipping package(2)")
+                ):
+                    _log.debug("skipping package(1)")
+                    self.__skipped_package_count += 1
+                    continue
+                if binary and packet_command == command:
+                    return self.__binary_package(payload)
+                data = self.__on_packet(packet_command, payload)
+                if packet_command == command:
+                    return data
                 else:
+                    _log.debug("skipping package(2)")
+        raise RTDEException(" _recv() Connection lost ")
+
+    def __recv_recipe(self, recipe_id, binary=False):
+        queue = self.__recipe_queues[recipe_id]
+        while self.is_connected():
+            try:
+                # Do not block when a package is already waiting
+                self.__recv_to_buffer(0 if queue else DEFAULT_TIMEOUT)
+            except RTDETimeoutException:
+                return None
+
+            while True:
+                packet = self.__next_packet()
+                if packet is None:
                     break
+                packet_command, payload = packet
+                if packet_command == Command.RTDE_DATA_PACKAGE:
+                    self.__queue_package(payload)
+                else:
+                    self.__on_packet(packet_command, payload)
+            if queue:
+                payload = queue.pop()
+                self.__skipped_package_count += len(queue)
+                queue.clear()
+                if binary:
+                    return self.__binary_package(payload)
+                return self.__data_handler(memoryview(payload))
         raise RTDEException(" _recv() Connection lost ")
 
+    def __binary_package(self, payload):
+        # Binary receives skip the data handler, but not the publisher
+        publisher = self.__publisher
+        if publisher is not None and payload[0] == publisher.config.id:
+            publisher.publish(payload)
+        return bytes(payload[1:])
+
+    def __queue_package(self, payload):
+        queue = self.__recipe_queues.get(payload[0])
+        if queue is None:
+            _log.error("RTDE_DATA_PACKAGE: Unknown recipe id " + str(payload[0]))
+            return
+        # payload points into the receive buffer, keep a copy
+        queue.append(bytes(payload))
+
     def __recv_to_buffer(self, timeout):
         readable, _, xlist = select.select([self.__sock], [], [self.__sock], timeout)
+        if self.__stats is not None:
+            self.__stats.on_select()
         if len(readable):
-            more = self.__sock.recv(4096)
+            if self.__kernel_timestamps:
+                received, self.__arrival_ns = self.__buf.fill_timestamped(self.__sock)
+            else:
+                received = self.__buf.fill(self.__sock)
+            if self.__stats is not None:
+                self.__stats.on_recv(received)
+                if self.__arrival_ns is not None and received:
+                    self.__stats.on_kernel_timestamp(self.__arrival_ns)
+            if self.__capture is not None and received:
+                unread = self.__buf.unread()
+                self.__capture.write_stream(unread[len(unread) - received :])
             # When the controller stops while the script is running
-            if len(more) == 0:
+            if received == 0:
                 _log.error(
                     "received 0 bytes from Controller, probable cause: Controller has stopped"
                 )
                 self.__trigger_disconnected()
                 raise RTDEException("received 0 bytes from Controller")
 
-            self.__buf = self.__buf + more
             return True
 
         if (
@@ -359,26 +993,24 @@ class RTDE(object):
         return False
 
     def __recv_from_buffer(self, command, binary=False):
-        # unpack_from requires a buffer of at least 3 bytes
-        while len(self.__buf) >= 3:
-            # Attempts to extract a packet
-            packet_header = serialize.ControlHeader.unpack(self.__buf)
-
-            if len(self.__buf) >= packet_header.size:
-                packet, self.__buf = (
-                    self.__buf[3 : packet_header.size],
-                    self.__buf[packet_header.size :],
-                )
-                data = self.__on_packet(packet_header.command, packet)
-                if packet_header.command == command:
-                    if binary:
-                        return packet[1:]
-
-                    return data
-                else:
-                    _log.debug("skipping package(2)")
-            else:
+        while True:
+            packet = self.__next_packet()
+            if packet is None:
                 return None
+            packet_command, payload = packet
+            if binary and packet_command == command:
+                return self.__binary_package(payload)
+            data = self.__on_packet(packet_command, payload)
+            if packet_command == command:
+                return data
+            else:
+                _log.debug("skipping package(2)")
+
+    def __instrumented_next_packet(self):
+        packet = self.__buf.next_packet()
+        if packet is not None:
+            self.__stats.on_packet(packet[0], packet[0] == Command.RTDE_DATA_PACKAGE)
+        return packet
 
     def __trigger_disconnected(self):
         _log.info("RTDE disconnected")
@@ -403,9 +1035,9 @@ class RTDE(object):
             _log.error("RTDE_TEXT_MESSAGE: No payload")
             return None
         if self.__protocolVersion == RTDE_PROTOCOL_VERSION_1:
-            msg = serialize.MessageV1.unpack(payload)
+            msg = serialize.MessageV1.unpack(bytes(payload))
         else:
-            msg = serialize.Message.unpack(payload)
+            msg = serialize.Message.unpack(bytes(payload))
 
         if (
             msg.level == serialize.Message.EXCEPTION_MESSAGE
@@ -421,14 +1053,14 @@ class RTDE(object):
         if len(payload) < 1:
             _log.error("RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS: No payload")
             return None
-        output_config = serialize.DataConfig.unpack_recipe(payload)
+        output_config = serialize.DataConfig.unpack_recipe(bytes(payload))
         return output_config
 
     def __unpack_setup_inputs_package(self, payload):
         if len(payload) < 1:
             _log.error("RTDE_CONTROL_PACKAGE_SETUP_INPUTS: No payload")
             return None
-        input_config = serialize.DataConfig.unpack_recipe(payload)
+        input_config = serialize.DataConfig.unpack_recipe(bytes(payload))
         return input_config
 
     def __unpack_start_package(self, payload):
@@ -445,12 +1077,26 @@ class RTDE(object):
         result = serialize.ReturnValue.unpack(payload)
         return result.success
 
-    def __unpack_data_package(self, payload, output_config):
-        if output_config is None:
+    def __unpack_data_package(self, payload):
+        config = self.__output_configs.get(payload[0])
+        if config is None:
+            _log.error("RTDE_DATA_PACKAGE: Missing output configuration")
+            return None
+        return config.codec.unpack(payload)
+
+    def __unpack_array_data_package(self, payload):
+        config = self.__output_configs.get(payload[0])
+        if config is None:
+            _log.error("RTDE_DATA_PACKAGE: Missing output configuration")
+            return None
+        return config.codec.unpack_arrays(payload)
+
+    def __unpack_lazy_data_package(self, payload):
+        config = self.__output_configs.get(payload[0])
+        if config is None:
             _log.error("RTDE_DATA_PACKAGE: Missing output configuration")
             return None
-        output = output_config.unpack(payload)
-        return output
+        return config.codec.unpack_lazy(payload)
 
     def __list_equals(self, l1, l2):
         if len(l1) != len(l2):
@@ -464,3 +1110,92 @@ class RTDE(object):
     def skipped_package_count(self):
         """The skipped package count, resets on connect"""
         return self.__skipped_package_count
+
+
+class StateSnapshot(object):
+    __slots__ = ["sequence", "timestamp", "state"]
+
+    def __init__(self, sequence, timestamp, state):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.state = state
+
+
+class StateMailbox(object):
+    """Holds the newest state published by a BackgroundReceiver.
+
+    Every publish swaps in a new immutable StateSnapshot with an increasing
+    sequence number and the time.monotonic() arrival time, so latest() is a
+    plain attribute read. wait_next() blocks until a newer sequence number
+    has been published.
+    """
+
+    def __init__(self):
+        self.__snapshot = StateSnapshot(0, None, None)
+        self.__cond = threading.Condition()
+        self.__closed = False
+
+    def publish(self, state, timestamp):
+        with self.__cond:
+            self.__snapshot = StateSnapshot(
+                self.__snapshot.sequence + 1, timestamp, state
+            )
+            self.__cond.notify_all()
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+
+    @property
+    def closed(self):
+        return self.__closed
+
+    def latest(self):
+        return self.__snapshot
+
+    def wait_next(self, sequence=None, timeout=None):
+        """Wait for a snapshot newer than sequence (default: the current one).
+        Returns None on timeout or when the receiver has stopped.
+        """
+        with self.__cond:
+            if sequence is None:
+                sequence = self.__snapshot.sequence
+            if not self.__cond.wait_for(
+                lambda: self.__snapshot.sequence > sequence or self.__closed,
+                timeout,
+            ):
+                return None
+            if self.__snapshot.sequence > sequence:
+                return self.__snapshot
+            return None
+
+
+class BackgroundReceiver(threading.Thread):
+    """Drains an RTDE session and publishes every state to a StateMailbox."""
+
+    def __init__(self, connection, mailbox=None):
+        super(BackgroundReceiver, self).__init__(name="rtde-receiver")
+        self.daemon = True
+        self.mailbox = mailbox if mailbox is not None else StateMailbox()
+        self.error = None
+        self.__connection = connection
+        self.__stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.__stopped.is_set():
+                state = self.__connection.receive()
+                if state is not None:
+                    self.mailbox.publish(state, time.monotonic())
+        except RTDEException as e:
+            if not self.__stopped.is_set():
+                _log.error("Background receiver stopped: " + str(e))
+                self.error = e
+        finally:
+            self.mailbox.close()
+
+    def stop(self, timeout=None):
+        self.__stopped.set()
+        if threading.current_thread() is not self:
+            self.join(timeout)
@@ -0,0 +1,344 @@
+import asyncio
+import collections
+import logging
+import struct
+
+from . import serialize
+from .rtde import (
+    Command,
+    ConnectionState,
+    DEFAULT_TIMEOUT,
+    LOGNAME,
+    RTDE_PROTOCOL_VERSION_1,
+    RTDE_PROTOCOL_VERSION_2,
+    RTDEException,
+    RECIPE_QUEUE_SIZE,
+    ReceiveBuffer,
+)
+
+_log = logging.getLogger(LOGNAME)
+
+_header = struct.Struct(">HB")
+
+
+class AsyncRTDE(asyncio.BufferedProtocol):
+    """RTDE client for asyncio event loops.
+
+    Incoming bytes are received straight into a ReceiveBuffer and parsed in
+    place. Control requests are awaited one at a time; data packages are
+    delivered through packages(). Every output recipe has its own queue of
+    at most max_queue packages waiting to be received, older ones are
+    dropped and counted as skipped.
+    """
+
+    def __init__(self, hostname, port=30004, max_queue=RECIPE_QUEUE_SIZE):
+        self.hostname = hostname
+        self.port = port
+        self.__conn_state = ConnectionState.DISCONNECTED
+        self.__transport = None
+        self.__buf = ReceiveBuffer()
+        self.__output_config = None
+        self.__output_configs = {}
+        self.__input_config = {}
+        self.__protocolVersion = RTDE_PROTOCOL_VERSION_1
+        self.__request_lock = None
+        self.__reply = None
+        self.__reply_command = None
+        self.__max_queue = max_queue
+        # recipe id -> deque of (arrival number, payload)
+        self.__queues = {}
+        self.__arrivals = 0
+        self.__waiter = None
+        self.__drain_waiter = None
+        self.__skipped_package_count = 0
+
+    async def connect(self):
+        if self.__transport is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self.__request_lock = asyncio.Lock()
+        self.__buf.clear()
+        self.__skipped_package_count = 0
+        await asyncio.wait_for(
+            loop.create_connection(lambda: self, self.hostname, self.port),
+            DEFAULT_TIMEOUT,
+        )
+        if not await self.negotiate_protocol_version():
+            raise RTDEException("Unable to negotiate protocol version")
+
+    def disconnect(self):
+        if self.__transport is not None:
+            self.__transport.close()
+            self.__transport = None
+        self.__conn_state = ConnectionState.DISCONNECTED
+
+    def is_connected(self):
+        return self.__conn_state is not ConnectionState.DISCONNECTED
+
+    async def get_controller_version(self):
+        version = await self.__send_and_receive(Command.RTDE_GET_URCONTROL_VERSION)
+        if version:
+            return version.major, version.minor, version.bugfix, version.build
+        return None, None, None, None
+
+    async def negotiate_protocol_version(self):
+        payload = struct.pack(">H", RTDE_PROTOCOL_VERSION_2)
+        success = await self.__send_and_receive(
+            Command.RTDE_REQUEST_PROTOCOL_VERSION, payload
+        )
+        if success:
+            self.__protocolVersion = RTDE_PROTOCOL_VERSION_2
+        return success
+
+    async def send_input_setup(self, variables, types=[]):
+        payload = bytearray(",".join(variables), "utf-8")
+        result = await self.__send_and_receive(
+            Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS, payload
+        )
+        if result is None:
+            return None
+        if len(types) != 0 and list(result.types) != list(types):
+            _log.error(
+                "Data type inconsistency for input setup: "
+                + str(types)
+                + " - "
+                + str(result.types)
+            )
+            return None
+        result.names = variables
+        codec = result.compile()
+        self.__input_config[result.id] = result
+        return codec.create_empty(result.id)
+
+    async def send_output_setup(self, variables, types=[], frequency=125):
+        payload = struct.pack(">d", frequency) + ",".join(variables).encode("utf-8")
+        result = await self.__send_and_receive(
+            Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS, payload
+        )
+        if result is None:
+            return False
+        if len(types) != 0 and list(result.types) != list(types):
+            _log.error(
+                "Data type inconsistency for output setup: "
+                + str(types)
+                + " - "
+                + str(result.types)
+            )
+            return False
+        result.names = variables
+        result.compile()
+        self.__output_config = result
+        self.__output_configs[result.id] = result
+        self.__queue(result.id)
+        return result.id
+
+    async def send_start(self):
+        success = await self.__send_and_receive(Command.RTDE_CONTROL_PACKAGE_START)
+        if success:
+            _log.info("RTDE synchronization started")
+            self.__conn_state = ConnectionState.STARTED
+        else:
+            _log.error("RTDE synchronization failed to start")
+        return success
+
+    async def send_pause(self):
+        success = await self.__send_and_receive(Command.RTDE_CONTROL_PACKAGE_PAUSE)
+        if success:
+            _log.info("RTDE synchronization paused")
+            self.__conn_state = ConnectionState.PAUSED
+        else:
+            _log.error("RTDE synchronization failed to pause")
+        return success
+
+    async def send(self, input_data):
+        if self.__conn_state != ConnectionState.STARTED:
+            _log.error("Cannot send when RTDE synchronization is inactive")
+            return False
+        if not input_data.recipe_id in self.__input_config:
+            _log.error("Input configuration id not found: " + str(input_data.recipe_id))
+            return False
+        config = self.__input_config[input_data.recipe_id]
+        self.__write(Command.RTDE_DATA_PACKAGE, config.pack(input_data))
+        if self.__drain_waiter is not None:
+            await self.__drain_waiter
+        return True
+
+    async def receive(self, latest_only=True, recipe_id=None):
+        """Wait for the next data package.
+        With latest_only, packages of the same recipe that arrived since the
+        previous call are discarded and only the newest one is returned,
+        like RTDE.receive(). Otherwise every package is returned in order.
+        With several output recipes, recipe_id selects the recipe to wait
+        for, as returned by send_output_setup(). Packages of the other
+        recipes stay queued. Without recipe_id the next (or with
+        latest_only the newest) package of any recipe is returned.
+        """
+        if self.__output_config is None:
+            raise RTDEException("Output configuration not initialized")
+        queue = self.__select(latest_only, recipe_id)
+        while queue is None:
+            if not self.is_connected():
+                raise RTDEException("receive() Connection lost")
+            self.__waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.__waiter
+            finally:
+                self.__waiter = None
+            queue = self.__select(latest_only, recipe_id)
+        if latest_only:
+            _, payload = queue.pop()
+            self.__skipped_package_count += len(queue)
+            queue.clear()
+        else:
+            _, payload = queue.popleft()
+        config = self.__output_configs.get(payload[0])
+        if config is None:
+            raise RTDEException("Missing output configuration: " + str(payload[0]))
+        return config.unpack(payload)
+
+    async def packages(self, latest_only=False, recipe_id=None):
+        """Async iterator over incoming data packages, see receive().
+        Ends once the connection is lost and the queued packages are read.
+        """
+        while True:
+            try:
+                yield await self.receive(latest_only, recipe_id)
+            except RTDEException:
+                if self.is_connected():
+                    raise
+                return
+
+    # asyncio protocol callbacks
+
+    def connection_made(self, transport):
+        self.__transport = transport
+        self.__conn_state = ConnectionState.CONNECTED
+
+    def connection_lost(self, exc):
+        _log.info("RTDE disconnected")
+        self.__transport = None
+        self.__conn_state = ConnectionState.DISCONNECTED
+        error = RTDEException("Connection lost")
+        for waiter in (self.__reply, self.__waiter, self.__drain_waiter):
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(error)
+
+    def pause_writing(self):
+        self.__drain_waiter = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        waiter, self.__drain_waiter = self.__drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def get_buffer(self, sizehint):
+        return self.__buf.reserve()
+
+    def buffer_updated(self, nbytes):
+        self.__buf.commit(nbytes)
+        packet = self.__buf.next_packet()
+        while packet is not None:
+            self.__on_packet(*packet)
+            packet = self.__buf.next_packet()
+
+    def eof_received(self):
+        _log.error(
+            "received 0 bytes from Controller, probable cause: Controller has stopped"
+        )
+
+    # internals
+
+    def __on_packet(self, command, payload):
+        if command == Command.RTDE_DATA_PACKAGE:
+            queue = self.__queues.get(payload[0])
+            if queue is None:
+                queue = self.__queue(payload[0])
+            if len(queue) == queue.maxlen:
+                self.__skipped_package_count += 1
+            # payload points into the receive buffer, keep a copy
+            self.__arrivals += 1
+            queue.append((self.__arrivals, bytes(payload)))
+            if self.__waiter is not None and not self.__waiter.done():
+                self.__waiter.set_result(None)
+        elif command == Command.RTDE_TEXT_MESSAGE:
+            self.__on_text_message(bytes(payload))
+        elif command == self.__reply_command and self.__reply is not None:
+            if not self.__reply.done():
+                self.__reply.set_result(self.__unpack_reply(command, bytes(payload)))
+        else:
+            _log.debug("skipping package(2)")
+
+    def __queue(self, recipe_id):
+        queue = self.__queues.get(recipe_id)
+        if queue is None:
+            queue = collections.deque(maxlen=self.__max_queue)
+            self.__queues[recipe_id] = queue
+        return queue
+
+    def __select(self, latest_only, recipe_id):
+        """The queue to receive from, None while it is empty"""
+        if recipe_id is not None:
+            return self.__queues.get(recipe_id) or None
+        selected = None
+        for queue in self.__queues.values():
+            if not queue:
+                continue
+            if selected is None:
+                selected = queue
+            elif latest_only and queue[-1][0] > selected[-1][0]:
+                selected = queue
+            elif not latest_only and queue[0][0] < selected[0][0]:
+                selected = queue
+        return selected
+
+    def __unpack_reply(self, command, payload):
+        if command == Command.RTDE_GET_URCONTROL_VERSION:
+            return serialize.ControlVersion.unpack(payload)
+        elif command in (
+            Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS,
+            Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS,
+        ):
+            return serialize.DataConfig.unpack_recipe(payload)
+        return serialize.ReturnValue.unpack(payload).success
+
+    def __on_text_message(self, payload):
+        if len(payload) < 1:
+            _log.error("RTDE_TEXT_MESSAGE: No payload")
+            return
+        if self.__protocolVersion == RTDE_PROTOCOL_VERSION_1:
+            msg = serialize.MessageV1.unpack(payload)
+        else:
+            msg = serialize.Message.unpack(payload)
+        if msg.level in (
+            serialize.Message.EXCEPTION_MESSAGE,
+            serialize.Message.ERROR_MESSAGE,
+        ):
+            _log.error(msg.source + ": " + msg.message)
+        elif msg.level == serialize.Message.WARNING_MESSAGE:
+            _log.warning(msg.source + ": " + msg.message)
+        elif msg.level == serialize.Message.INFO_MESSAGE:
+            _log.info(msg.source + ": " + msg.message)
+
+    def __write(self, command, payload=b""):
+        if self.__transport is None:
+            raise RTDEException("Unable to send: not connected to Robot")
+        self.__transport.write(_header.pack(len(payload) + 3, command) + payload)
+
+    async def __send_and_receive(self, command, payload=b""):
+        async with self.__request_lock:
+            self.__reply_command = command
+            self.__reply = asyncio.get_running_loop().create_future()
+            try:
+                self.__write(command, payload)
+                return await asyncio.wait_for(self.__reply, DEFAULT_TIMEOUT)
+            except asyncio.TimeoutError:
+                _log.warning("no reply received within timeout")
+                return None
+            finally:
+                self.__reply = None
+                self.__reply_command = None
+
+    @property
+    def skipped_package_count(self):
+        """The skipped package count, resets on connect"""
+        return self.__skipped_package_count
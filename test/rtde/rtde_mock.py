@@ -0,0 +1,467 @@
+"""Local mock of a UR controller's RTDE interface.
+
+Speaks the RTDE protocol over TCP so that rtde.RTDE (and the example
+scripts) can run without a robot:
+
+    python -m rtde.rtde_mock --port 30004
+
+or from Python:
+
+    with MockController() as mock:
+        con = rtde.RTDE("127.0.0.1", mock.port)
+
+Outputs are synthetic. The robot follows the handshake of the UR
+rtde_control_loop example: output_int_register_0 is 1 while it waits for a
+setpoint, drops to 0 once input_int_register_0 is set to 1 and the TCP pose
+moves to input_double_register_0..5 within move_time seconds. Faults can be
+injected at runtime through MockController.faults.
+"""
+
+import argparse
+import logging
+import math
+import random
+import socket
+import struct
+import threading
+import time
+
+from . import serialize
+from .rtde import Command, LOGNAME, RTDE_PROTOCOL_VERSION_1
+from .rtde_variables import INPUT_VARIABLES, VARIABLES
+
+_log = logging.getLogger(LOGNAME + ".mock")
+
+_header = struct.Struct(">HB")
+
+MAX_FREQUENCY = 500.0
+
+
+_zero = dict(
+    (name, [t.convert()] * t.count if t.vector else t.convert())
+    for name, t in serialize.TYPES.items()
+)
+
+
+class Faults(object):
+    """Runtime fault injection, all off by default.
+
+    delay      extra seconds before every data package
+    jitter     random extra delay in [0, jitter) seconds
+    drop_rate  probability of silently dropping a data package
+    burst      hold back this many packages and send them at once
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.jitter = 0.0
+        self.drop_rate = 0.0
+        self.burst = 0
+
+
+class _Robot(object):
+    """Synthetic robot following the rtde_control_loop handshake."""
+
+    HOME = [-0.12, -0.43, 0.14, 0.0, 3.11, 0.04]
+    HOME_Q = [0.0, -1.57, 1.57, -1.57, -1.57, 0.0]
+
+    def __init__(self, move_time):
+        self.move_time = move_time
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.inputs = {}
+        self.outputs = {}
+        self.pose = list(self.HOME)
+        self.__move_from = list(self.HOME)
+        self.__move_to = list(self.HOME)
+        self.__move_start = None
+        self.__ready = True
+
+    def write(self, values):
+        with self.lock:
+            self.inputs.update(values)
+
+    def sample(self):
+        with self.lock:
+            now = time.monotonic()
+            self.__step(now)
+            return now - self.start, list(self.pose), self.__ready
+
+    def __step(self, now):
+        watchdog = self.inputs.get("input_int_register_0", 0)
+        if self.__ready and watchdog == 1:
+            self.__ready = False
+            self.__move_from = list(self.pose)
+            self.__move_to = [
+                float(self.inputs.get("input_double_register_%d" % i, p))
+                for i, p in enumerate(self.pose)
+            ]
+            self.__move_start = now
+        if self.__move_start is not None:
+            fraction = min(1.0, (now - self.__move_start) / self.move_time)
+            self.pose = [
+                a + (b - a) * fraction for a, b in zip(self.__move_from, self.__move_to)
+            ]
+            if fraction >= 1.0:
+                self.__move_start = None
+        if not self.__ready and self.__move_start is None and watchdog == 0:
+            self.__ready = True
+
+    def value(self, name, data_type, t, pose, ready):
+        if name in self.outputs:
+            return self.outputs[name]
+        if name in self.inputs:
+            return self.inputs[name]
+        if name == "timestamp":
+            return t
+        if name == "output_int_register_0":
+            return 1 if ready else 0
+        if name in ("actual_TCP_pose", "target_TCP_pose"):
+            return pose
+        if name in ("actual_q", "target_q"):
+            return [q + 0.1 * math.sin(t + i) for i, q in enumerate(self.HOME_Q)]
+        if name in ("actual_qd", "target_qd"):
+            return [0.1 * math.cos(t + i) for i in range(6)]
+        if name == "actual_TCP_force":
+            return [0.5 * math.sin(3 * t + i) for i in range(6)]
+        if name == "robot_mode":
+            return 7  # ROBOT_MODE_RUNNING
+        if name == "safety_mode":
+            return 1  # SAFETY_MODE_NORMAL
+        if name == "runtime_state":
+            return 2  # playing
+        if name == "speed_scaling":
+            return 1.0
+        return _zero[data_type]
+
+
+class _OutputRecipe(object):
+    def __init__(self, recipe_id, names, types, frequency):
+        self.id = recipe_id
+        self.names = names
+        self.types = types
+        self.config = serialize.DataConfig.unpack_recipe(
+            bytes(bytearray([recipe_id])) + ",".join(types).encode("utf-8")
+        )
+        self.config.names = names
+        self.config.compile()
+        self.period = 1.0 / max(min(frequency, MAX_FREQUENCY), 1e-3)
+        self.next_time = None
+
+
+class _Session(object):
+    def __init__(self, controller, sock):
+        self.controller = controller
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.protocol = RTDE_PROTOCOL_VERSION_1
+        self.outputs = {}
+        self.inputs = {}
+        self.next_id = 1
+        self.started = threading.Event()
+        # set by START, the streamer then restarts every recipe's schedule
+        self.restart = False
+        self.closed = False
+        self.held = []
+
+    def send(self, command, payload):
+        with self.send_lock:
+            self.sock.sendall(_header.pack(len(payload) + 3, command) + payload)
+
+    def close(self):
+        self.closed = True
+        self.started.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def serve(self):
+        streamer = threading.Thread(target=self.stream, daemon=True)
+        streamer.start()
+        buf = b""
+        try:
+            while not self.closed:
+                more = self.sock.recv(65536)
+                if not more:
+                    break
+                buf += more
+                while len(buf) >= 3:
+                    size, command = _header.unpack_from(buf)
+                    if len(buf) < size:
+                        break
+                    payload, buf = buf[3:size], buf[size:]
+                    self.on_packet(command, payload)
+        except OSError:
+            pass
+        finally:
+            self.closed = True
+            self.started.set()
+            self.controller._release(self)
+
+    def on_packet(self, command, payload):
+        if command == Command.RTDE_REQUEST_PROTOCOL_VERSION:
+            version = struct.unpack(">H", payload)[0]
+            ok = version in (1, 2)
+            if ok:
+                self.protocol = version
+            self.send(command, struct.pack(">B", ok))
+        elif command == Command.RTDE_GET_URCONTROL_VERSION:
+            self.send(command, struct.pack(">IIII", *self.controller.version))
+        elif command == Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS:
+            if self.protocol == RTDE_PROTOCOL_VERSION_1:
+                frequency, names = MAX_FREQUENCY, payload
+            else:
+                frequency, names = struct.unpack_from(">d", payload)[0], payload[8:]
+            names = names.decode("utf-8").split(",")
+            types = [VARIABLES.get(n, "NOT_FOUND") for n in names]
+            recipe_id = 0
+            if "NOT_FOUND" not in types:
+                recipe_id = self.__allocate_id()
+                self.outputs[recipe_id] = _OutputRecipe(
+                    recipe_id, names, types, frequency
+                )
+            self.__send_recipe(command, recipe_id, types)
+        elif command == Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS:
+            names = payload.decode("utf-8").split(",")
+            types = self.controller._claim_inputs(self, names)
+            recipe_id = 0
+            if not any(t in ("NOT_FOUND", "IN_USE") for t in types):
+                recipe_id = self.__allocate_id()
+                config = serialize.DataConfig.unpack_recipe(
+                    bytes(bytearray([recipe_id])) + ",".join(types).encode("utf-8")
+                )
+                config.names = names
+                config.compile()
+                self.inputs[recipe_id] = config
+            self.__send_recipe(command, recipe_id, types)
+        elif command == Command.RTDE_CONTROL_PACKAGE_START:
+            self.restart = True
+            self.started.set()
+            self.send(command, struct.pack(">B", 1))
+        elif command == Command.RTDE_CONTROL_PACKAGE_PAUSE:
+            self.started.clear()
+            self.send(command, struct.pack(">B", 1))
+        elif command == Command.RTDE_DATA_PACKAGE:
+            config = self.inputs.get(bytearray(payload)[0])
+            if config is None:
+                _log.warning("Data package for unknown input recipe")
+                return
+            state = config.unpack(payload)
+            self.controller.robot.write(dict(zip(state._fields, state.to_tuple())))
+            self.controller.packages_received += 1
+        elif command == Command.RTDE_TEXT_MESSAGE:
+            _log.info("Client message: %r", payload)
+        else:
+            _log.warning("Unknown package command: %d", command)
+
+    def __allocate_id(self):
+        recipe_id = self.next_id
+        self.next_id += 1
+        return recipe_id
+
+    def __send_recipe(self, command, recipe_id, types):
+        self.send(
+            command,
+            bytes(bytearray([recipe_id])) + ",".join(types).encode("utf-8"),
+        )
+
+    def stream(self):
+        faults = self.controller.faults
+        robot = self.controller.robot
+        while not self.closed:
+            if not self.started.is_set():
+                self.started.wait()
+                continue
+            recipes = list(self.outputs.values())
+            if not recipes:
+                time.sleep(0.01)
+                continue
+            now = time.monotonic()
+            due = []
+            restart, self.restart = self.restart, False
+            for recipe in recipes:
+                if restart or recipe.next_time is None:
+                    recipe.next_time = now
+                if recipe.next_time <= now:
+                    due.append(recipe)
+                    recipe.next_time += recipe.period
+                    if recipe.next_time < now:
+                        # fell behind, do not try to catch up
+                        recipe.next_time = now + recipe.period
+            if due:
+                t, pose, ready = robot.sample()
+                for recipe in due:
+                    self.__send_data(recipe, t, pose, ready, faults)
+            wait = min(r.next_time for r in recipes) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def __send_data(self, recipe, t, pose, ready, faults):
+        robot = self.controller.robot
+        values = [
+            robot.value(name, data_type, t, pose, ready)
+            for name, data_type in zip(recipe.names, recipe.types)
+        ]
+        state = recipe.config.codec.record.from_tuple(values, recipe.id)
+        payload = recipe.config.pack(state)
+        if faults.drop_rate and random.random() < faults.drop_rate:
+            return
+        delay = faults.delay + (random.random() * faults.jitter if faults.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        packet = _header.pack(len(payload) + 3, Command.RTDE_DATA_PACKAGE) + payload
+        if faults.burst:
+            self.held.append(packet)
+            if len(self.held) < faults.burst:
+                return
+            packet, self.held = b"".join(self.held), []
+        try:
+            with self.send_lock:
+                self.sock.sendall(packet)
+            self.controller.packages_sent += 1
+        except OSError:
+            self.closed = True
+
+
+class MockController(object):
+    """Threaded RTDE server on localhost, see the module docstring."""
+
+    def __init__(self, host="127.0.0.1", port=0, version=(5, 11, 0, 0), move_time=0.5):
+        self.host = host
+        self.port = port
+        self.version = version
+        self.faults = Faults()
+        self.robot = _Robot(move_time)
+        self.packages_sent = 0
+        self.packages_received = 0
+        self.__server = None
+        self.__sessions = []
+        self.__input_owners = {}
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def inputs(self):
+        """Input variable values last written by clients"""
+        return self.robot.inputs
+
+    @property
+    def outputs(self):
+        """Output values to report instead of the synthetic ones"""
+        return self.robot.outputs
+
+    def start(self):
+        self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.bind((self.host, self.port))
+        self.__server.listen(32)
+        self.port = self.__server.getsockname()[1]
+        threading.Thread(target=self.__accept, daemon=True).start()
+        return self.host, self.port
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.close()
+            self.__server = None
+        self.disconnect_clients()
+
+    def disconnect_clients(self):
+        with self.__lock:
+            sessions, self.__sessions = self.__sessions, []
+        for session in sessions:
+            session.close()
+
+    def send_text_message(
+        self, message, source="Mock", level=serialize.Message.INFO_MESSAGE
+    ):
+        message = message.encode("utf-8")
+        source = source.encode("utf-8")
+        payload = struct.pack(
+            ">B%dsB%dsB" % (len(message), len(source)),
+            len(message),
+            message,
+            len(source),
+            source,
+            level,
+        )
+        with self.__lock:
+            sessions = list(self.__sessions)
+        for session in sessions:
+            session.send(Command.RTDE_TEXT_MESSAGE, payload)
+
+    def __accept(self):
+        server = self.__server
+        while True:
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(self, sock)
+            with self.__lock:
+                self.__sessions.append(session)
+            threading.Thread(target=session.serve, daemon=True).start()
+
+    def _claim_inputs(self, session, names):
+        types = []
+        with self.__lock:
+            for name in names:
+                if name not in INPUT_VARIABLES:
+                    types.append("NOT_FOUND")
+                elif self.__input_owners.get(name, session) is not session:
+                    types.append("IN_USE")
+                else:
+                    types.append(VARIABLES[name])
+            if not any(t in ("NOT_FOUND", "IN_USE") for t in types):
+                for name in names:
+                    self.__input_owners[name] = session
+        return types
+
+    def _release(self, session):
+        with self.__lock:
+            for name, owner in list(self.__input_owners.items()):
+                if owner is session:
+                    del self.__input_owners[name]
+            if session in self.__sessions:
+                self.__sessions.remove(session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock RTDE controller")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=30004)
+    parser.add_argument("--move-time", type=float, default=0.5)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--burst", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    mock = MockController(args.host, args.port, move_time=args.move_time)
+    mock.faults.drop_rate = args.drop_rate
+    mock.faults.delay = args.delay
+    mock.faults.jitter = args.jitter
+    mock.faults.burst = args.burst
+    host, port = mock.start()
+    print("Mock RTDE controller listening on %s:%d" % (host, port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
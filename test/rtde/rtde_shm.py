@@ -0,0 +1,166 @@
+import struct
+import time
+
+from multiprocessing import resource_tracker, shared_memory
+
+from . import serialize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"RTDESHM1"
+
+# magic, sequence, timestamp, payload size, description size
+_header = struct.Struct("=8sQdII")
+_sequence = struct.Struct("=Q")
+_timestamp = struct.Struct("=d")
+
+SEQUENCE_OFFSET = 8
+TIMESTAMP_OFFSET = 16
+
+# Blocks created by publishers of this process
+_published = set()
+
+
+def _payload_offset(description_size):
+    # keep the payload 8 byte aligned
+    return (_header.size + description_size + 7) & ~7
+
+
+class SharedStatePublisher(object):
+    """Publishes the newest data package of one output recipe to a named
+    shared memory block.
+
+    The block holds a fixed header, the recipe description and the raw
+    data package payload, so its layout follows from the recipe. Writes
+    are guarded by a seqlock: the sequence number is odd while a payload
+    is being copied in and even once it is complete.
+    """
+
+    def __init__(self, name, config):
+        description = config.pack_description()
+        self.config = config
+        self.__offset = _payload_offset(len(description))
+        size = self.__offset + config.codec.size
+        self.__shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _published.add(self.__shm.name)
+        self.__buf = self.__shm.buf
+        self.__sequence = 0
+        _header.pack_into(
+            self.__buf, 0, MAGIC, 0, 0.0, config.codec.size, len(description)
+        )
+        self.__buf[_header.size : _header.size + len(description)] = description
+        self.__payload = self.__buf[self.__offset : size]
+
+    @property
+    def name(self):
+        return self.__shm.name
+
+    @property
+    def sequence(self):
+        return self.__sequence
+
+    def publish(self, payload, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        buf = self.__buf
+        self.__sequence += 1
+        _sequence.pack_into(buf, SEQUENCE_OFFSET, self.__sequence)
+        self.__payload[:] = payload
+        _timestamp.pack_into(buf, TIMESTAMP_OFFSET, timestamp)
+        self.__sequence += 1
+        _sequence.pack_into(buf, SEQUENCE_OFFSET, self.__sequence)
+
+    def close(self, unlink=True):
+        self.__payload.release()
+        self.__buf = None
+        self.__shm.close()
+        _published.discard(self.__shm.name)
+        if unlink:
+            self.__shm.unlink()
+
+
+class SharedStateReader(object):
+    """Maps a block written by SharedStatePublisher, in any local process.
+
+    read() returns a consistent copy decoded like RTDE.receive(). arrays
+    maps every field to a NumPy view of the payload in place (big-endian,
+    as on the wire), e.g. reader.arrays["actual_TCP_pose"]. The views change
+    while they are read, use begin() and retry() around the reads for a
+    consistent set.
+    """
+
+    def __init__(self, name):
+        self.__shm = shared_memory.SharedMemory(name)
+        # The publisher owns the block, do not let this process remove it.
+        # A publisher in this process shares the tracker registration.
+        if self.__shm.name not in _published:
+            resource_tracker.unregister(self.__shm._name, "shared_memory")
+        self.__buf = self.__shm.buf
+        magic, _, _, size, description_size = _header.unpack_from(self.__buf)
+        if magic != MAGIC:
+            self.__shm.close()
+            raise ValueError("Not an RTDE shared state block: " + name)
+        self.config = serialize.DataConfig.unpack_description(
+            self.__buf[_header.size : _header.size + description_size]
+        )
+        self.config.compile()
+        offset = _payload_offset(description_size)
+        self.__payload = self.__buf[offset : offset + size]
+        self.arrays = None
+        if np is not None:
+            records = np.frombuffer(self.__payload, dtype=self.config.codec.dtype)
+            records.flags.writeable = False
+            self.arrays = {}
+            for name in self.config.names:
+                field = records[name]
+                # vectors as (n,) views, scalars as 0-d views
+                self.arrays[name] = field[0] if field.ndim > 1 else field.reshape(())
+
+    @property
+    def sequence(self):
+        """Publish count times two, odd while an update is in progress"""
+        return _sequence.unpack_from(self.__buf, SEQUENCE_OFFSET)[0]
+
+    def begin(self):
+        """Wait out a running update and return the sequence to retry() on"""
+        sequence = self.sequence
+        while sequence & 1:
+            sequence = self.sequence
+        return sequence
+
+    def retry(self, sequence):
+        """True if the block changed since begin() returned sequence"""
+        return self.sequence != sequence
+
+    def read(self):
+        """Return (sequence, timestamp, state) of the newest publish, state
+        is None before the first one."""
+        while True:
+            sequence = self.begin()
+            payload = bytes(self.__payload)
+            timestamp = _timestamp.unpack_from(self.__buf, TIMESTAMP_OFFSET)[0]
+            if not self.retry(sequence):
+                break
+        if sequence == 0:
+            return sequence, None, None
+        return sequence, timestamp, self.config.codec.unpack(payload)
+
+    def wait_next(self, sequence, timeout=None, interval=0.0005):
+        """Poll until a publish newer than sequence, then read() it.
+        Returns None on timeout."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.begin() <= sequence:
+            if end is not None and time.monotonic() >= end:
+                return None
+            time.sleep(interval)
+        return self.read()
+
+    def close(self):
+        """Unmap the block, views taken from arrays must be dropped first"""
+        self.arrays = None
+        self.__payload.release()
+        self.__buf = None
+        self.__shm.close()
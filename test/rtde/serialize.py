@@ -21,8 +21,18 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import keyword
+import operator
+import re
 import struct
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_identifier = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
 
 class ControlHeader(object):
     __slots__ = [
@@ -95,35 +105,110 @@ class Message(object):
         return rmd
 
 
+class FieldType(object):
+    """Everything the package needs to know about one RTDE data type.
+
+    code      struct format code of one element (big-endian on the wire)
+    count     number of elements, vectors have more than one
+    size      bytes on the wire
+    dtype     NumPy type of one element
+    convert   Python type of one element
+    element   type name of one element, as used for CSV columns
+    """
+
+    __slots__ = ["name", "code", "count", "size", "dtype", "convert", "element"]
+
+    def __init__(self, name, code, count, dtype, convert, element=None):
+        self.name = name
+        self.code = code
+        self.count = count
+        self.size = struct.calcsize(">" + code) * count
+        self.dtype = dtype
+        self.convert = convert
+        self.element = element or name
+
+    @property
+    def vector(self):
+        return self.name.startswith("VECTOR")
+
+    @property
+    def format(self):
+        return self.code * self.count
+
+    def columns(self, name):
+        """CSV column names of a field of this type"""
+        if self.vector:
+            return [name + "_" + str(i) for i in range(self.count)]
+        return [name]
+
+
+TYPES = dict(
+    (field_type.name, field_type)
+    for field_type in (
+        FieldType("BOOL", "?", 1, "?", bool),
+        FieldType("UINT8", "B", 1, "u1", int),
+        FieldType("UINT32", "I", 1, ">u4", int),
+        FieldType("UINT64", "Q", 1, ">u8", int),
+        FieldType("INT32", "i", 1, ">i4", int),
+        FieldType("INT64", "q", 1, ">i8", int),
+        FieldType("DOUBLE", "d", 1, ">f8", float),
+        FieldType("VECTOR3D", "d", 3, ">f8", float, "DOUBLE"),
+        FieldType("VECTOR6D", "d", 6, ">f8", float, "DOUBLE"),
+        FieldType("VECTOR6INT32", "i", 6, ">i4", int, "INT32"),
+        FieldType("VECTOR6UINT32", "I", 6, ">u4", int, "UINT32"),
+    )
+)
+
+
+def get_field_type(data_type):
+    field_type = TYPES.get(data_type)
+    if field_type is None:
+        if data_type == "IN_USE":
+            raise ValueError("An input parameter is already in use.")
+        raise ValueError("Unknown data type: " + data_type)
+    return field_type
+
+
 def get_item_size(data_type):
-    if data_type.startswith("VECTOR6"):
-        return 6
-    elif data_type.startswith("VECTOR3"):
-        return 3
-    return 1
+    field_type = TYPES.get(data_type)
+    return field_type.count if field_type is not None else 1
+
+
+def numpy_dtype(names, types):
+    """Structured dtype matching the wire layout of a data package."""
+    fields = [("recipe_id", "u1")]
+    for i in range(len(names)):
+        field_type = get_field_type(types[i])
+        if field_type.vector:
+            fields.append((names[i], field_type.dtype, (field_type.count,)))
+        else:
+            fields.append((names[i], field_type.dtype))
+    return np.dtype(fields)
 
 
 def unpack_field(data, offset, data_type):
-    size = get_item_size(data_type)
-    if data_type == "VECTOR6D" or data_type == "VECTOR3D":
-        return [float(data[offset + i]) for i in range(size)]
-    elif data_type == "VECTOR6UINT32":
-        return [int(data[offset + i]) for i in range(size)]
-    elif data_type == "DOUBLE":
-        return float(data[offset])
-    elif data_type == "UINT32" or data_type == "UINT64":
-        return int(data[offset])
-    elif data_type == "VECTOR6INT32":
-        return [int(data[offset + i]) for i in range(size)]
-    elif data_type == "INT32" or data_type == "UINT8":
-        return int(data[offset])
-    elif data_type == "BOOL":
-        return bool(data[offset])
-    raise ValueError("unpack_field: unknown data type: " + data_type)
+    field_type = TYPES.get(data_type)
+    if field_type is None:
+        raise ValueError("unpack_field: unknown data type: " + data_type)
+    convert = field_type.convert
+    if field_type.vector:
+        return [convert(data[offset + i]) for i in range(field_type.count)]
+    return convert(data[offset])
 
 
 class DataObject(object):
+    """Base class of the per-recipe record types, see record_type()."""
+
+    __slots__ = ()
     recipe_id = None
+    _fields = ()
+
+    @classmethod
+    def from_tuple(cls, values, recipe_id=None):
+        return cls(recipe_id, *values)
+
+    def to_tuple(self):
+        return tuple(getattr(self, name) for name in self._fields)
 
     def pack(self, names, types):
         if len(names) != len(types):
@@ -132,75 +217,405 @@ class DataObject(object):
         if self.recipe_id is not None:
             l.append(self.recipe_id)
         for i in range(len(names)):
-            if self.__dict__[names[i]] is None:
+            value = getattr(self, names[i])
+            if value is None:
                 raise ValueError("Uninitialized parameter: " + names[i])
-            if types[i].startswith("VECTOR"):
-                l.extend(self.__dict__[names[i]])
+            if get_field_type(types[i]).vector:
+                l.extend(value)
             else:
-                l.append(self.__dict__[names[i]])
+                l.append(value)
         return l
 
+    def __reduce__(self):
+        return (_restore_record, (self._fields, self.recipe_id, self.to_tuple()))
+
+    def __repr__(self):
+        return "DataObject(recipe_id=%r, %s)" % (
+            self.recipe_id,
+            ", ".join("%s=%r" % (n, getattr(self, n)) for n in self._fields),
+        )
+
     @staticmethod
     def unpack(data, names, types):
         if len(names) != len(types):
             raise ValueError("List sizes are not identical.")
-        obj = DataObject()
+        values = []
         offset = 0
-        obj.recipe_id = data[0]
         for i in range(len(names)):
-            obj.__dict__[names[i]] = unpack_field(data[1:], offset, types[i])
+            values.append(unpack_field(data[1:], offset, types[i]))
             offset += get_item_size(types[i])
-        return obj
+        return record_type(names).from_tuple(values, data[0])
 
     @staticmethod
     def create_empty(names, recipe_id):
-        obj = DataObject()
-        for i in range(len(names)):
-            obj.__dict__[names[i]] = None
-        obj.recipe_id = recipe_id
-        return obj
+        return record_type(names).from_tuple([None] * len(names), recipe_id)
+
+
+_record_types = {}
+
+
+def record_type(names):
+    """Return the DataObject subclass with __slots__ for exactly these names.
+
+    The class is generated on first use and cached, so all recipes with the
+    same field names share one type.
+    """
+    key = tuple(names)
+    cls = _record_types.get(key)
+    if cls is not None:
+        return cls
+    for name in key:
+        if (
+            not _identifier.match(name)
+            or keyword.iskeyword(name)
+            or hasattr(DataObject, name)
+        ):
+            raise ValueError("Invalid field name: " + name)
+
+    source = "def __init__(self, recipe_id%s):\n    self.recipe_id = recipe_id\n" % (
+        "".join(", " + name for name in key)
+    )
+    for name in key:
+        source += "    self.%s = %s\n" % (name, name)
+    namespace = {}
+    exec(source, namespace)
+
+    members = {
+        "__slots__": ("recipe_id",) + key,
+        "__init__": namespace["__init__"],
+        "_fields": key,
+    }
+    if len(key) == 1:
+        getter = operator.attrgetter(key[0])
+        members["to_tuple"] = lambda self: (getter(self),)
+    elif key:
+        getter = operator.attrgetter(*key)
+        members["to_tuple"] = lambda self: getter(self)
+    cls = type("DataObject", (DataObject,), members)
+    _record_types[key] = cls
+    return cls
+
+
+def _restore_record(names, recipe_id, values):
+    return record_type(names).from_tuple(values, recipe_id)
+
+
+def _lazy_getattr(self, name):
+    # Only called for fields not decoded yet, the value is then cached in
+    # the slot so later reads are plain attribute access
+    try:
+        unpack_from, offset, is_vector = self._decoders[name]
+    except KeyError:
+        raise AttributeError(name)
+    values = unpack_from(self._payload, offset)
+    value = list(values) if is_vector else values[0]
+    setattr(self, name, value)
+    return value
+
+
+def _field_layout(fmt, names, types):
+    """Yield (name, codes, offset, is_vector) for every field of a recipe,
+    offset is the position in the data package payload."""
+    position = 2  # fmt[0] is the byte order, fmt[1] the recipe id
+    offset = 1
+    for i in range(len(names)):
+        field_type = get_field_type(types[i])
+        codes = fmt[position : position + field_type.count]
+        yield names[i], codes, offset, field_type.vector
+        position += len(codes)
+        offset += field_type.size
+
+
+def lazy_record_type(fmt, names, types):
+    """Subclass of record_type(names) decoding fields on first access.
+
+    Instances keep a copy of the payload and decode each field with its own
+    Struct when it is first read. They are full DataObjects otherwise:
+    fields can be assigned, to_tuple() decodes whatever is left.
+    """
+    decoders = {}
+    for name, codes, offset, is_vector in _field_layout(fmt, names, types):
+        decoders[name] = (struct.Struct(">" + codes).unpack_from, offset, is_vector)
+    members = {
+        "__slots__": ("_payload",),
+        "__getattr__": _lazy_getattr,
+        "_decoders": decoders,
+    }
+    return type("DataObject", (record_type(names),), members)
+
+
+class RecipeCodec(object):
+    """Pack/unpack plan compiled once per negotiated recipe.
+
+    Decoding a package is a single Struct.unpack_from followed by a
+    generated constructor call on the recipe's record type. struct already
+    yields float, int and bool objects for the recipe format codes, so
+    scalars are passed as they are and only vectors need converting (a tuple
+    slice to a list). Packing is likewise one generated Struct.pack call
+    that reads the fields straight off the state.
+    """
+
+    __slots__ = [
+        "struct",
+        "values_struct",
+        "size",
+        "record",
+        "fields",
+        "decode",
+        "decode_arrays",
+        "arrays_struct",
+        "lazy",
+        "dtype",
+        "_pack",
+        "_pack_values_into",
+    ]
+
+    def __init__(self, fmt, names, types):
+        if len(names) != len(types):
+            raise ValueError("List sizes are not identical.")
+        self.struct = struct.Struct(fmt)
+        self.values_struct = struct.Struct(">" + fmt[2:])  # without recipe id
+        self.size = self.struct.size
+        self.record = record_type(names)
+        self.fields = []
+        arguments = []
+        array_arguments = []
+        array_types = {}
+        # Vectors are viewed by frombuffer, the struct for decode_arrays
+        # skips them with pad bytes like a RecipeView
+        array_fmt = fmt[:2]
+        pad = 0
+        index = 1  # index 0 is the recipe id
+        scalar_index = 1
+        layout = _field_layout(fmt, names, types)
+        for i, (name, codes, offset, is_vector) in enumerate(layout):
+            width = len(codes)
+            if is_vector:
+                arguments.append("list(v[%d:%d])" % (index, index + width))
+                array_types["t%d" % i] = TYPES[types[i]].dtype
+                array_arguments.append(
+                    "frombuffer(p, t%d, %d, %d)" % (i, width, offset)
+                )
+                pad += struct.calcsize(">" + codes)
+            else:
+                arguments.append("v[%d]" % index)
+                array_arguments.append("v[%d]" % scalar_index)
+                if pad:
+                    array_fmt += "%dx" % pad
+                    pad = 0
+                array_fmt += codes
+                scalar_index += 1
+            self.fields.append((name, is_vector))
+            index += width
+        if pad:
+            array_fmt += "%dx" % pad
+        self.arrays_struct = struct.Struct(array_fmt)
+        values = "".join(
+            (", *s.%s" if is_vector else ", s.%s") % name
+            for name, is_vector in self.fields
+        )
+        namespace = {
+            "record": self.record,
+            "pack": self.struct.pack,
+            "pack_into": self.values_struct.pack_into,
+        }
+        exec(
+            "def decode(v):\n    return record(v[0]%s)\n"
+            "def _pack(s):\n    return pack(s.recipe_id%s)\n"
+            "def _pack_values_into(buf, offset, s):\n    pack_into(buf, offset%s)\n"
+            % ("".join(", " + a for a in arguments), values, values),
+            namespace,
+        )
+        self.decode = namespace["decode"]
+        self.decode_arrays = None
+        if np is not None:
+            array_namespace = {"record": self.record, "frombuffer": np.frombuffer}
+            for key, value in array_types.items():
+                array_namespace[key] = np.dtype(value)
+            exec(
+                "def decode_arrays(p, v):\n    return record(v[0]%s)\n"
+                % "".join(", " + a for a in array_arguments),
+                array_namespace,
+            )
+            self.decode_arrays = array_namespace["decode_arrays"]
+        self.lazy = lazy_record_type(fmt, names, types)
+        self._pack = namespace["_pack"]
+        self._pack_values_into = namespace["_pack_values_into"]
+        self.dtype = numpy_dtype(names, types) if np is not None else None
+
+    def pack(self, state):
+        try:
+            return self._pack(state)
+        except (struct.error, TypeError):
+            self.__check_initialized(state)
+            raise
+
+    def pack_values_into(self, buf, offset, state):
+        """Pack the fields (not the recipe id) into buf at offset."""
+        try:
+            self._pack_values_into(buf, offset, state)
+        except (struct.error, TypeError):
+            self.__check_initialized(state)
+            raise
+
+    def __check_initialized(self, state):
+        for name, _ in self.fields:
+            if getattr(state, name) is None:
+                raise ValueError("Uninitialized parameter: " + name)
+
+    def unpack(self, data):
+        return self.decode(self.struct.unpack_from(data))
+
+    def unpack_arrays(self, data):
+        """Like unpack(), but vectors are read-only NumPy arrays viewing a
+        copy of the payload (big-endian, as on the wire)."""
+        if self.decode_arrays is None:
+            raise ImportError("NumPy is required for array decoding")
+        data = bytes(data)
+        return self.decode_arrays(data, self.arrays_struct.unpack_from(data))
+
+    def unpack_lazy(self, data):
+        """Like unpack(), but fields are decoded when first read."""
+        if len(data) != self.size:
+            raise ValueError("Data package size does not match the recipe")
+        state = object.__new__(self.lazy)
+        # data may point into a receive buffer that is about to be reused
+        state._payload = bytes(data)
+        state.recipe_id = state._payload[0]
+        return state
+
+    def unpack_batch(self, payloads):
+        """Decode a list of data package payloads into a structured array.
+
+        The payloads are joined once and viewed with the recipe dtype, the
+        returned array is read-only.
+        """
+        if self.dtype is None:
+            raise ImportError("NumPy is required for batch decoding")
+        data = b"".join(payloads)
+        if len(data) != self.size * len(payloads):
+            raise ValueError("Data package size does not match the recipe")
+        return np.frombuffer(data, dtype=self.dtype)
+
+    def create_empty(self, recipe_id):
+        return self.record.from_tuple([None] * len(self.fields), recipe_id)
+
+
+class RecipeView(object):
+    """Decoder for a projection of an output recipe.
+
+    The selected fields are read with one Struct that skips all other
+    fields with pad bytes, into a record type holding only those fields,
+    in the order given. unpack() takes a data package payload with or
+    without the recipe id byte (receive(binary=True) strips it), so any
+    number of views can decode the same frame.
+    """
+
+    __slots__ = ["recipe_id", "names", "struct", "record", "decode"]
+
+    def __init__(self, config, names=None):
+        self.recipe_id = config.id
+        self.names = list(config.names if names is None else names)
+        if len(set(self.names)) != len(self.names):
+            raise ValueError("Duplicate field in view: " + ",".join(self.names))
+        for name in self.names:
+            if name not in config.names:
+                raise ValueError("Field not in the output recipe: " + name)
+        fmt = ">"
+        pad = 0
+        positions = {}
+        index = 0
+        for name, codes, _, is_vector in _field_layout(
+            config.fmt, config.names, config.types
+        ):
+            if name not in self.names:
+                pad += struct.calcsize(">" + codes)
+                continue
+            if pad:
+                fmt += "%dx" % pad
+                pad = 0
+            fmt += codes
+            positions[name] = (index, len(codes), is_vector)
+            index += len(codes)
+        if pad:
+            fmt += "%dx" % pad
+        self.struct = struct.Struct(fmt)
+        self.record = record_type(self.names)
+        arguments = []
+        for name in self.names:
+            index, width, is_vector = positions[name]
+            if is_vector:
+                arguments.append("list(v[%d:%d])" % (index, index + width))
+            else:
+                arguments.append("v[%d]" % index)
+        namespace = {"record": self.record, "recipe_id": self.recipe_id}
+        exec(
+            "def decode(v):\n    return record(recipe_id%s)\n"
+            % "".join(", " + a for a in arguments),
+            namespace,
+        )
+        self.decode = namespace["decode"]
+
+    def unpack(self, data):
+        skip = len(data) - self.struct.size
+        if skip != 0 and skip != 1:
+            raise ValueError("Data package size does not match the recipe")
+        return self.decode(self.struct.unpack_from(data, skip))
 
 
 class DataConfig(object):
-    __slots__ = ["id", "names", "types", "fmt"]
+    __slots__ = ["id", "names", "types", "fmt", "codec"]
 
     @staticmethod
     def unpack_recipe(buf):
         rmd = DataConfig()
+        rmd.codec = None
         rmd.id = struct.unpack_from(">B", buf)[0]
         rmd.types = buf.decode("utf-8")[1:].split(",")
-        rmd.fmt = ">B"
-        for i in rmd.types:
-            if i == "INT32":
-                rmd.fmt += "i"
-            elif i == "UINT32":
-                rmd.fmt += "I"
-            elif i == "VECTOR6D":
-                rmd.fmt += "d" * 6
-            elif i == "VECTOR3D":
-                rmd.fmt += "d" * 3
-            elif i == "VECTOR6INT32":
-                rmd.fmt += "i" * 6
-            elif i == "VECTOR6UINT32":
-                rmd.fmt += "I" * 6
-            elif i == "DOUBLE":
-                rmd.fmt += "d"
-            elif i == "UINT64":
-                rmd.fmt += "Q"
-            elif i == "UINT8":
-                rmd.fmt += "B"
-            elif i == "BOOL":
-                rmd.fmt += "?"
-            elif i == "IN_USE":
-                raise ValueError("An input parameter is already in use.")
-            else:
-                raise ValueError("Unknown data type: " + i)
+        rmd.fmt = ">B" + "".join(get_field_type(i).format for i in rmd.types)
         return rmd
 
+    def pack_description(self):
+        """The setup reply payload followed by a newline and the names, so
+        the recipe can be rebuilt without the controller."""
+        return (
+            bytes(bytearray([self.id]))
+            + ",".join(self.types).encode("utf-8")
+            + b"\n"
+            + ",".join(self.names).encode("utf-8")
+        )
+
+    @staticmethod
+    def unpack_description(buf):
+        recipe, names = bytes(buf).split(b"\n")
+        rmd = DataConfig.unpack_recipe(recipe)
+        rmd.names = names.decode("utf-8").split(",")
+        return rmd
+
+    def compile(self):
+        """Build the codec, names must be assigned first."""
+        self.codec = RecipeCodec(self.fmt, self.names, self.types)
+        return self.codec
+
     def pack(self, state):
-        l = state.pack(self.names, self.types)
-        return struct.pack(self.fmt, *l)
+        codec = self.codec or self.compile()
+        return codec.pack(state)
 
     def unpack(self, data):
-        li = struct.unpack_from(self.fmt, data)
-        return DataObject.unpack(li, self.names, self.types)
+        codec = self.codec or self.compile()
+        return codec.unpack(data)
+
+    def view(self, names=None):
+        return RecipeView(self, names)
+
+    def unpack_arrays(self, data):
+        codec = self.codec or self.compile()
+        return codec.unpack_arrays(data)
+
+    def unpack_lazy(self, data):
+        codec = self.codec or self.compile()
+        return codec.unpack_lazy(data)
+
+    def unpack_batch(self, payloads):
+        codec = self.codec or self.compile()
+        return codec.unpack_batch(payloads)
@@ -0,0 +1,147 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import asyncio
+import unittest
+
+from rtde.rtde import RTDEException
+from rtde.rtde_async import AsyncRTDE
+from rtde.rtde_mock import MockController
+
+
+async def open_session(port, names, frequency=500, max_queue=1024):
+    con = AsyncRTDE("127.0.0.1", port, max_queue=max_queue)
+    await con.connect()
+    await con.get_controller_version()
+    recipe_id = await con.send_output_setup(names, frequency=frequency)
+    if not recipe_id:
+        raise RuntimeError("output setup failed")
+    return con, recipe_id
+
+
+async def drain(con, **kwargs):
+    """Receive until nothing arrives for a while, returns the states"""
+    states = []
+    while True:
+        try:
+            states.append(await asyncio.wait_for(con.receive(**kwargs), 0.2))
+        except asyncio.TimeoutError:
+            return states
+
+
+class AsyncTest(unittest.TestCase):
+    def setUp(self):
+        self.mock = MockController()
+        self.mock.start()
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def run_async(self, coroutine):
+        return asyncio.run(asyncio.wait_for(coroutine, 30))
+
+    def test_sessions_on_one_loop(self):
+        recipes = [
+            ["timestamp"],
+            ["timestamp", "actual_q"],
+            ["actual_TCP_pose", "output_int_register_0"],
+        ]
+
+        async def session(names, seconds):
+            con, _ = await open_session(self.mock.port, names)
+            await con.send_start()
+            states = []
+            end = asyncio.get_running_loop().time() + seconds
+            async for state in con.packages():
+                states.append(state)
+                if asyncio.get_running_loop().time() >= end:
+                    break
+            await con.send_pause()
+            con.disconnect()
+            return states
+
+        async def run_all():
+            return await asyncio.gather(*(session(names, 0.5) for names in recipes))
+
+        results = self.run_async(run_all())
+        for names, states in zip(recipes, results):
+            self.assertGreater(len(states), 50)
+            for state in states:
+                self.assertEqual(state._fields, tuple(names))
+
+    def test_bounded_queue_counts_skips(self):
+        async def run():
+            con, _ = await open_session(self.mock.port, ["timestamp"], max_queue=4)
+            await con.send_start()
+            # nobody reads while the mock streams
+            await asyncio.sleep(0.3)
+            self.mock.faults.drop_rate = 1.0
+            await asyncio.sleep(0.1)
+            states = await drain(con, latest_only=False)
+            skipped = con.skipped_package_count
+            con.disconnect()
+            return states, skipped
+
+        states, skipped = self.run_async(run())
+        self.assertEqual(len(states), 4)
+        self.assertGreater(skipped, 50)
+        self.assertEqual(len(states) + skipped, self.mock.packages_sent)
+        timestamps = [state.timestamp for state in states]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_packages_end_on_disconnect(self):
+        async def session():
+            con, _ = await open_session(self.mock.port, ["timestamp"])
+            await con.send_start()
+            count = 0
+            async for _ in con.packages():
+                count += 1
+            self.assertFalse(con.is_connected())
+            return count
+
+        async def run_all():
+            tasks = [asyncio.ensure_future(session()) for _ in range(3)]
+            await asyncio.sleep(0.3)
+            self.mock.disconnect_clients()
+            return await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+        for count in self.run_async(run_all()):
+            self.assertGreater(count, 0)
+
+    def test_receive_disconnected_raises(self):
+        async def run():
+            con, _ = await open_session(self.mock.port, ["timestamp"])
+            await con.send_start()
+            await con.receive()
+            self.mock.disconnect_clients()
+            with self.assertRaises(RTDEException):
+                # the queued packages first
+                while True:
+                    await con.receive(latest_only=False)
+
+        self.run_async(run())
+
+    def test_latest_only_keeps_other_recipes(self):
+        async def run():
+            con, fast = await open_session(self.mock.port, ["timestamp"], 500)
+            slow = await con.send_output_setup(["actual_q"], frequency=50)
+            await con.send_start()
+            await asyncio.sleep(0.3)
+            self.mock.faults.drop_rate = 1.0
+            await asyncio.sleep(0.1)
+            latest = await con.receive(latest_only=True, recipe_id=fast)
+            # the packages of the slow recipe were not discarded
+            other = await asyncio.wait_for(con.receive(latest_only=True), 1)
+            con.disconnect()
+            return latest, other, slow
+
+        latest, other, slow = self.run_async(run())
+        self.assertEqual(latest._fields, ("timestamp",))
+        self.assertEqual(other.recipe_id, slow)
+        self.assertEqual(other._fields, ("actual_q",))
+
+
+if __name__ == "__main__":
+    unittest.main()
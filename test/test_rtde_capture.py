@@ -0,0 +1,63 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import struct
+import tempfile
+import unittest
+
+import rtde.rtde as rtde
+from rtde import rtde_capture, serialize
+
+
+def make_config():
+    config = serialize.DataConfig.unpack_recipe(bytes([1]) + b"DOUBLE,INT32")
+    config.names = ["timestamp", "output_int_register_0"]
+    config.compile()
+    return config
+
+
+def packet(config, timestamp):
+    state = config.codec.create_empty(1)
+    state.timestamp = timestamp
+    state.output_int_register_0 = 7
+    payload = config.pack(state)
+    return struct.pack(">HB", len(payload) + 3, rtde.Command.RTDE_DATA_PACKAGE) + payload
+
+
+class CaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(tempfile.mkdtemp(), "session.cap")
+        self.config = make_config()
+
+    def test_session_resets_replay(self):
+        first = packet(self.config, 1.0)
+        writer = rtde_capture.CaptureWriter(self.filename)
+        writer.write_session(timestamp=5 * 10**9)
+        writer.write_recipe(self.config, timestamp=5 * 10**9)
+        # The connection dropped in the middle of a packet
+        writer.write_stream(first + first[:5], timestamp=5 * 10**9)
+        writer.close()
+        # Appended after a reboot, the monotonic clock went backwards
+        writer = rtde_capture.CaptureWriter(self.filename)
+        writer.write_session(timestamp=10**9)
+        writer.write_recipe(self.config, timestamp=10**9)
+        writer.write_stream(packet(self.config, 2.0), timestamp=10**9)
+        writer.close()
+
+        replay = rtde_capture.Replay(self.filename, speed=1.0)
+        states = [state.timestamp for _, state in replay]
+        self.assertEqual(states, [1.0, 2.0])
+
+    def test_invalid_packet_size_raises(self):
+        buf = rtde.ReceiveBuffer()
+        data = struct.pack(">HB", 0, rtde.Command.RTDE_DATA_PACKAGE) + b"\x00" * 8
+        view = buf.reserve()
+        view[: len(data)] = data
+        buf.commit(len(data))
+        self.assertRaises(rtde.RTDEException, buf.next_packet)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import math
+import tempfile
+import threading
+import time
+import unittest
+
+import rtde.rtde as rtde
+from rtde.rtde_mock import MockController
+from rtde.rtde_proxy import RTDEProxy
+
+PROXY_FREQUENCY = 500
+
+
+class Subscriber(threading.Thread):
+    """A proxy client counting the data packages it receives"""
+
+    def __init__(self, path, names, frequency, stalled=False):
+        threading.Thread.__init__(self, daemon=True)
+        self.names = names
+        self.frequency = frequency
+        # a stalled subscriber never reads
+        self.stalled = stalled
+        self.con = rtde.RTDE(path)
+        self.con.connect()
+        self.con.get_controller_version()
+        if not self.con.send_output_setup(names, frequency=frequency):
+            raise RuntimeError("output setup failed")
+        self.con.send_start()
+        self.received = 0
+        self.fields_ok = True
+        self.done = threading.Event()
+
+    def run(self):
+        idle_since = None
+        while True:
+            state = self.con.receive_buffered()
+            if state is None:
+                if self.done.is_set():
+                    if idle_since is None:
+                        idle_since = time.monotonic()
+                    elif time.monotonic() - idle_since > 0.3:
+                        break
+                time.sleep(0.001)
+                continue
+            idle_since = None
+            self.received += 1
+            if state._fields != tuple(self.names):
+                self.fields_ok = False
+
+    def close(self):
+        self.done.set()
+        if self.is_alive():
+            self.join(10)
+        self.con.disconnect()
+
+
+class ProxyTestCase(unittest.TestCase):
+    """An RTDEProxy of a mock controller, served from a thread"""
+
+    output_names = ["timestamp", "output_int_register_0"]
+
+    def setUp(self):
+        self.mock = MockController()
+        self.mock.start()
+        # Nothing is streamed until the subscribers are ready
+        self.mock.faults.drop_rate = 1.0
+        self.path = os.path.join(tempfile.mkdtemp(), "rtde.sock")
+        self.robot = rtde.RTDE("127.0.0.1", self.mock.port)
+        self.robot.connect()
+        self.proxy = RTDEProxy(
+            self.robot, self.path, self.output_names, frequency=PROXY_FREQUENCY
+        )
+        self.thread = threading.Thread(target=self.proxy.run)
+        self.thread.start()
+        self.subscribers = []
+
+    def tearDown(self):
+        for subscriber in self.subscribers:
+            subscriber.done.set()
+        self.proxy.stop()
+        self.thread.join(10)
+        self.proxy.close()
+        self.robot.disconnect()
+        self.mock.stop()
+
+    def subscribe(self, names, frequency, stalled=False):
+        subscriber = Subscriber(self.path, names, frequency, stalled)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def stream(self, seconds, jitter=0.0):
+        """Let the mock stream for a while, return the frames sent"""
+        for subscriber in self.subscribers:
+            if not subscriber.stalled:
+                subscriber.start()
+        start = self.proxy.packages
+        self.mock.faults.jitter = jitter
+        self.mock.faults.drop_rate = 0.0
+        time.sleep(seconds)
+        self.mock.faults.drop_rate = 1.0
+        time.sleep(0.2)
+        for subscriber in self.subscribers:
+            subscriber.done.set()
+        for subscriber in self.subscribers:
+            subscriber.close()
+        return self.proxy.packages - start
+
+    @staticmethod
+    def expected(frames, frequency):
+        if frequency >= PROXY_FREQUENCY:
+            return frames
+        return int(math.ceil(frames / float(round(PROXY_FREQUENCY / frequency))))
+
+
+class ProxyTest(ProxyTestCase):
+    def test_full_rate_and_decimated(self):
+        full = self.subscribe(["timestamp"], PROXY_FREQUENCY)
+        quarter = self.subscribe(["timestamp"], PROXY_FREQUENCY / 4)
+        frames = self.stream(1.0, jitter=0.0005)
+        self.assertGreater(frames, 100)
+        self.assertTrue(full.fields_ok and quarter.fields_ok)
+        self.assertEqual(full.received, frames)
+        self.assertEqual(quarter.received, self.expected(frames, PROXY_FREQUENCY / 4))
+
+
+class ProxyFanOutTest(ProxyTestCase):
+    # about 800 bytes a frame, a stalled client fills its socket and queue
+    output_names = (
+        ["timestamp", "output_int_register_0"]
+        + ["target_q", "target_qd", "target_qdd", "target_current", "target_moment"]
+        + ["actual_q", "actual_qd", "actual_current", "joint_control_output"]
+        + ["actual_TCP_pose", "actual_TCP_speed", "actual_TCP_force"]
+        + ["target_TCP_pose", "target_TCP_speed", "joint_temperatures"]
+    )
+
+    def test_mixed_subscribers_and_a_stalled_one(self):
+        frequencies = [500, 250, 125, 100, 50]
+        for i in range(20):
+            # every subscriber takes a different slice of the proxy recipe
+            start = i % (len(self.output_names) - 1)
+            names = self.output_names[start : start + 1 + i % 4]
+            self.subscribe(names, frequencies[i % len(frequencies)])
+        stalled = self.subscribe(self.output_names, 500, stalled=True)
+        frames = self.stream(1.5)
+        self.assertGreater(frames, 300)
+        for subscriber in self.subscribers:
+            if subscriber is stalled:
+                continue
+            self.assertTrue(subscriber.fields_ok)
+            self.assertEqual(
+                subscriber.received, self.expected(frames, subscriber.frequency)
+            )
+        sent, dropped = self.proxy.clients()[-1]
+        self.assertGreater(dropped, 0)
+        self.assertEqual(sent + dropped, frames)
+
+
+if __name__ == "__main__":
+    unittest.main()